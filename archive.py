@@ -0,0 +1,339 @@
+"""
+Export of OSDF namespaces to, and import from, gzip compressed files of
+newline delimited JSON, with checkpoints to resume interrupted runs.
+"""
+
+import gzip
+import json
+import os
+
+from lazy import LazyDocument
+import workers
+
+# The query used to export every node of a namespace
+MATCH_ALL = '{"query": {"match_all": {}}}'
+
+def _read_checkpoint(path):
+    if not os.path.isfile(path):
+        return None
+
+    with open(path) as checkpoint:
+        return json.load(checkpoint)
+
+def _write_checkpoint(path, state):
+    """
+    Replaces the checkpoint file in a single step, so that an interruption
+    never leaves it half written.
+    """
+    temp_path = path + ".tmp"
+
+    with open(temp_path, 'w') as checkpoint:
+        json.dump(state, checkpoint)
+
+    os.rename(temp_path, path)
+
+def _document_line(document):
+    if isinstance(document, LazyDocument):
+        document = document.materialize()
+
+    return json.dumps(document, sort_keys=True, separators=(',', ':')) + "\n"
+
+def export_namespace(osdf, namespace, path, query=None, checkpoint=None,
+                     max_workers=None):
+    """
+    Writes the nodes of a namespace, or only those matching an ElasticSearch
+    query, to a gzip compressed file of newline delimited JSON. Pages of
+    results are retrieved concurrently, up to max_workers at a time if
+    provided, and written in order. The client's query cache is bypassed, so
+    that no stale pages are exported.
+
+    Each page is written as a complete gzip member, after which the progress
+    is recorded in the checkpoint file (path + ".checkpoint" by default). If
+    the export is interrupted, running it again with the same arguments
+    discards any partly written page and carries on from the next one. The
+    checkpoint file is removed once the export completes.
+
+    Returns a dictionary with the number of 'pages' and 'documents' in the
+    file.
+    """
+    if query is None:
+        query = MATCH_ALL
+
+    if checkpoint is None:
+        checkpoint = path + ".checkpoint"
+
+    state = _read_checkpoint(checkpoint)
+
+    if state is not None and (state['namespace'] != namespace or
+                              state['query'] != query):
+        raise Exception("Checkpoint %s is for a different export." % \
+                        checkpoint)
+
+    if state is None or not os.path.isfile(path):
+        state = {
+            'namespace': namespace,
+            'query': query,
+            'total': None,
+            'page_size': None,
+            'pages': 0,
+            'documents': 0,
+            'offset': 0
+        }
+
+    def fetch(page):
+        """ Retrieves a page of results, bypassing any query cache. """
+        return osdf.query(namespace, query, page, cached=False)
+
+    def pages():
+        """ Generates the pages of results after those already exported. """
+        page = state['pages'] + 1
+
+        if state['total'] is None:
+            results = fetch(page)
+
+            state['total'] = results.get('search_result_total')
+            state['page_size'] = results['result_count']
+
+            yield (page, results)
+
+            if results['result_count'] == 0:
+                return
+
+            page += 1
+
+        total = state['total']
+        page_size = state['page_size']
+
+        # Request the remaining pages concurrently, then one at a time in
+        # case the namespace grew, until a page is not full.
+        if total is not None and page_size:
+            last_page = -(-total // page_size)
+            concurrency = max_workers or osdf.controller.maximum
+
+            for (_, page_number, results, error) in workers.imap(
+                    fetch, range(page, last_page + 1), concurrency,
+                    controller=osdf.controller, idempotent=True):
+                if error is not None:
+                    raise error
+
+                yield (page_number, results)
+
+                if results['result_count'] < page_size:
+                    return
+
+            page = max(page, last_page + 1)
+
+        while True:
+            results = fetch(page)
+
+            yield (page, results)
+
+            if results['result_count'] == 0 or \
+                    results['result_count'] < page_size:
+                return
+
+            page += 1
+
+    if state['offset'] > 0:
+        output = open(path, 'r+b')
+    else:
+        output = open(path, 'wb')
+
+    try:
+        # Discard anything written after the last checkpoint
+        output.truncate(state['offset'])
+        output.seek(state['offset'])
+
+        results = pages()
+
+        try:
+            for (page, page_results) in results:
+                documents = page_results['results']
+
+                if len(documents) > 0:
+                    member = gzip.GzipFile(fileobj=output, mode='wb')
+
+                    for document in documents:
+                        member.write(_document_line(document))
+
+                    member.close()
+                    output.flush()
+
+                state['pages'] = page
+                state['documents'] += len(documents)
+                state['offset'] = output.tell()
+
+                _write_checkpoint(checkpoint, state)
+        finally:
+            results.close()
+    finally:
+        output.close()
+
+    os.remove(checkpoint)
+
+    return {'pages': state['pages'], 'documents': state['documents']}
+
+def _read_documents(path):
+    """
+    Generates the documents of an export file, one at a time.
+    """
+    with gzip.open(path, 'rb') as data:
+        for line in data:
+            if line.strip():
+                yield json.loads(line)
+
+def _linked_ids(document):
+    targets = set()
+
+    for linked in document.get('linkage', {}).values():
+        targets.update(linked)
+
+    return targets
+
+def _levels(path):
+    """
+    Assigns each node of an export file to a level, such that the nodes it
+    links to, if they are in the file too, are at lower levels. Returns the
+    dictionary of node IDs to levels, and the set of the IDs of nodes that
+    cannot be ordered because their linkage is circular.
+    """
+    dependencies = {}
+
+    for document in _read_documents(path):
+        dependencies[document['id']] = _linked_ids(document)
+
+    for node_id in dependencies:
+        dependencies[node_id] &= set(dependencies)
+
+    levels = {}
+    remaining = set(dependencies)
+    level = 0
+
+    while remaining:
+        ready = [node_id for node_id in remaining
+                 if dependencies[node_id].issubset(levels)]
+
+        if not ready:
+            break
+
+        for node_id in ready:
+            levels[node_id] = level
+
+        remaining.difference_update(ready)
+        level += 1
+
+    return (levels, remaining)
+
+def import_namespace(osdf, path, checkpoint=None, concurrency=None):
+    """
+    Inserts the nodes of a file written by export_namespace(). As OSDF
+    assigns new IDs to inserted nodes, the linkages between the nodes in the
+    file are rewritten to the new IDs, so every node is only inserted once
+    the nodes it links to have been. Each level of such dependencies is
+    inserted concurrently, up to concurrency at a time if provided. Linkages
+    to nodes that are not in the file are kept as they are.
+
+    The ID given to each inserted node is recorded in the checkpoint file
+    (path + ".checkpoint" by default) as soon as it is known. If the import
+    is interrupted, or some nodes fail, running it again with the same
+    arguments only inserts the nodes that have not been. The checkpoint
+    file is removed once every node has been inserted.
+
+    Returns a dictionary with the number of nodes 'inserted', 'skipped'
+    (inserted by an earlier run) and 'failed', a list of the (node_id, error)
+    tuples of the failures as 'errors', and the dictionary of the original
+    node IDs to their new IDs as 'ids'.
+    """
+    if checkpoint is None:
+        checkpoint = path + ".checkpoint"
+
+    new_ids = {}
+
+    if os.path.isfile(checkpoint):
+        with open(checkpoint) as previous:
+            for line in previous:
+                fields = line.split()
+
+                # A line cut short by an interruption is ignored
+                if len(fields) == 2:
+                    new_ids[fields[0]] = fields[1]
+
+    summary = {
+        'inserted': 0,
+        'skipped': len(new_ids),
+        'failed': 0,
+        'errors': [],
+        'ids': new_ids
+    }
+
+    (levels, circular) = _levels(path)
+
+    for node_id in circular:
+        summary['failed'] += 1
+        summary['errors'].append(
+            (node_id, Exception("Unable to import node. Reason: Its " + \
+                                "linkage is circular."))
+        )
+
+    failed = set(circular)
+
+    def documents(level, inserting):
+        """
+        Generates the documents of a level that have not been inserted, with
+        their linkages rewritten to the new IDs, and appends their original
+        IDs to inserting.
+        """
+        for document in _read_documents(path):
+            node_id = document['id']
+
+            if levels.get(node_id) != level or node_id in new_ids:
+                continue
+
+            unresolved = [target for target in _linked_ids(document)
+                          if target in failed]
+
+            if unresolved:
+                failed.add(node_id)
+                summary['failed'] += 1
+                summary['errors'].append((node_id, Exception(
+                    "Unable to import node. Reason: Linked node %s was " \
+                    "not imported." % unresolved[0]
+                )))
+                continue
+
+            del document['id']
+            document.pop('ver', None)
+
+            document['linkage'] = dict(
+                (linkage, [new_ids.get(target, target) for target in targets])
+                for (linkage, targets) in document.get('linkage', {}).items()
+            )
+
+            inserting.append(node_id)
+
+            yield document
+
+    with open(checkpoint, 'a') as record:
+        for level in range(max(levels.values()) + 1 if levels else 0):
+            inserting = []
+
+            for (index, new_id, error) in osdf.insert_nodes(
+                    documents(level, inserting), concurrency, ordered=False):
+                node_id = inserting[index]
+
+                if error is not None:
+                    failed.add(node_id)
+                    summary['failed'] += 1
+                    summary['errors'].append((node_id, error))
+                    continue
+
+                new_ids[node_id] = new_id
+                summary['inserted'] += 1
+
+                record.write("%s %s\n" % (node_id, new_id))
+                record.flush()
+
+    if not failed:
+        os.remove(checkpoint)
+
+    return summary
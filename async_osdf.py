@@ -0,0 +1,688 @@
+"""
+Asynchronous (asyncio) Python OSDF client module. Requires Python 3.6 or
+later.
+"""
+
+import asyncio
+import base64
+import json
+import time
+import zlib
+
+# Methods that may safely be sent again if the server's response was lost
+IDEMPOTENT_METHODS = frozenset(['GET', 'HEAD', 'PUT', 'DELETE'])
+
+class _AsyncConnectionPool(object):
+    """
+    A pool of persistent, non-blocking HTTP/1.1 connections to a single OSDF
+    server. No more than limit connections are ever open at once; further
+    requests wait for a connection to be released.
+    """
+
+    def __init__(self, server, port=8123, ssl=False, limit=100,
+                 idle_timeout=30):
+        self.server = server
+        self.port = port
+        self.ssl = ssl
+        self.limit = limit
+        self.idle_timeout = idle_timeout
+
+        self._idle = []
+        self._closed = False
+
+        # Created on first use, as before Python 3.10 a semaphore is bound to
+        # the event loop current when it is created, which need not be the
+        # one the pool is used from.
+        self._semaphore = None
+
+    async def get(self, fresh=False):
+        """
+        Check a connection out of the pool, waiting if the limit has been
+        reached. Returns a tuple of the (reader, writer) pair and a boolean
+        indicating whether it was reused from the idle list.
+        """
+        if self._closed:
+            raise Exception("Connection pool is closed.")
+
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.limit)
+
+        await self._semaphore.acquire()
+
+        try:
+            while self._idle and not fresh:
+                (reader, writer, last_used) = self._idle.pop()
+
+                if time.time() - last_used > self.idle_timeout or \
+                        reader.at_eof() or writer.transport.is_closing():
+                    writer.close()
+                    continue
+
+                return ((reader, writer), True)
+
+            (reader, writer) = await asyncio.open_connection(
+                self.server, self.port, ssl=self.ssl or None
+            )
+        except BaseException:
+            self._semaphore.release()
+            raise
+
+        return ((reader, writer), False)
+
+    def put(self, connection, reusable=True):
+        """
+        Return a connection to the pool. Connections that can't be reused
+        are closed instead.
+        """
+        (reader, writer) = connection
+
+        if reusable and not self._closed and not reader.at_eof():
+            self._idle.append((reader, writer, time.time()))
+        else:
+            writer.close()
+
+        self._semaphore.release()
+
+    def close(self):
+        """
+        Close all the idle connections and refuse any further checkouts.
+        """
+        self._closed = True
+
+        for (_, writer, _) in self._idle:
+            writer.close()
+
+        self._idle = []
+
+class AsyncHttpRequest(object):
+    """
+    Issues HTTP requests to an OSDF server over pooled, non-blocking
+    connections.
+    """
+
+    def __init__(self, server, username, password, port=8123, ssl=False,
+                 limit=100):
+        self.server = server
+        self.port = port
+        self.username = username
+        self.password = password
+        self.ssl = ssl
+        self.pool = _AsyncConnectionPool(server, port, ssl, limit=limit)
+
+    def _request_head(self, method, resource, data):
+        credentials = "%s:%s" % (self.username, self.password)
+        auth = base64.b64encode(credentials.encode('utf-8')).decode('ascii')
+
+        lines = [
+            "%s %s HTTP/1.1" % (method, resource),
+            "Host: %s:%s" % (self.server, self.port),
+            "Authorization: Basic %s" % auth,
+            "Connection: keep-alive",
+            "Accept-Encoding: gzip, deflate"
+        ]
+
+        if data is not None:
+            lines.append("Content-Length: %d" % len(data))
+
+        return ("\r\n".join(lines) + "\r\n\r\n").encode('latin-1')
+
+    async def _read_response(self, reader):
+        status_line = await reader.readline()
+
+        if not status_line:
+            raise ConnectionResetError("Connection closed by server.")
+
+        code = int(status_line.split(None, 2)[1])
+
+        headers = {}
+
+        while True:
+            line = await reader.readline()
+
+            if line in (b"\r\n", b"\n", b""):
+                break
+
+            (name, value) = line.decode('latin-1').split(":", 1)
+            headers[name.strip().lower()] = value.strip()
+
+        reusable = headers.get('connection', '').lower() != 'close'
+
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            chunks = []
+
+            while True:
+                size = int((await reader.readline()).split(b";")[0], 16)
+
+                if size == 0:
+                    await reader.readline()
+                    break
+
+                chunks.append(await reader.readexactly(size))
+                await reader.readline()
+
+            content = b"".join(chunks)
+        elif 'content-length' in headers:
+            content = await reader.readexactly(int(headers['content-length']))
+        elif code in (204, 304):
+            content = b""
+        else:
+            content = await reader.read()
+            reusable = False
+
+        encoding = headers.get('content-encoding', '').lower()
+
+        if encoding in ('gzip', 'x-gzip'):
+            content = zlib.decompress(content, 16 + zlib.MAX_WBITS)
+        elif encoding == 'deflate':
+            try:
+                content = zlib.decompress(content)
+            except zlib.error:
+                content = zlib.decompress(content, -zlib.MAX_WBITS)
+
+        return (code, headers, content, reusable)
+
+    async def _send_request(self, connection, method, resource, data):
+        (_, writer) = connection
+
+        writer.write(self._request_head(method, resource, data))
+
+        if data is not None:
+            writer.write(data)
+
+        await writer.drain()
+
+    async def _request(self, method, resource, data=None):
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+
+        (connection, reused) = await self.pool.get()
+        sent = False
+
+        try:
+            await self._send_request(connection, method, resource, data)
+            sent = True
+            response = await self._read_response(connection[0])
+        except (ConnectionError, asyncio.IncompleteReadError):
+            self.pool.put(connection, False)
+
+            # A kept-alive connection may have been closed by the server
+            # while it sat idle. Try once more on a fresh connection, unless
+            # the request was sent and is not idempotent, as the server may
+            # have acted on it.
+            if not reused or (sent and method not in IDEMPOTENT_METHODS):
+                raise
+
+            (connection, reused) = await self.pool.get(fresh=True)
+
+            try:
+                await self._send_request(connection, method, resource, data)
+                response = await self._read_response(connection[0])
+            except BaseException:
+                self.pool.put(connection, False)
+                raise
+        except BaseException:
+            self.pool.put(connection, False)
+            raise
+
+        (code, headers, content, reusable) = response
+
+        self.pool.put(connection, reusable)
+
+        results = {"headers": headers,
+                   "content": content,
+                   "code": code
+                  }
+
+        return results
+
+    async def delete(self, resource):
+        return await self._request("DELETE", resource)
+
+    async def get(self, resource):
+        return await self._request("GET", resource)
+
+    async def put(self, resource, data):
+        return await self._request("PUT", resource, data)
+
+    async def post(self, resource, data):
+        return await self._request("POST", resource, data)
+
+    def close(self):
+        """
+        Close the pooled connections.
+        """
+        self.pool.close()
+
+class AsyncOSDF(object):
+    """
+    Communicates with an OSDF server's REST interface from asyncio code. The
+    methods mirror those of the OSDF class, but are coroutines, and many
+    requests may be in flight at once on a single event loop. No more than
+    limit connections to the server are opened at a time.
+    """
+
+    def __init__(self, server, username, password, port=8123, ssl=False,
+                 limit=100):
+        self._server = server
+        self._port = port
+        self._username = username
+        self._password = password
+        self._ssl = ssl
+        self._limit = limit
+        self._request = AsyncHttpRequest(server, username, password, port,
+                                         ssl, limit)
+
+    @property
+    def server(self):
+        """
+        Retrieve the server the client is configured for.
+        """
+        return self._server
+
+    @property
+    def port(self):
+        """
+        Retrieve the TCP port for the client.
+        """
+        return self._port
+
+    @property
+    def username(self):
+        """
+        Retrieve the username set for the client.
+        """
+        return self._username
+
+    @property
+    def ssl(self):
+        """
+        Retrieve whether the client will use SSL or not.
+        """
+        return self._ssl
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """
+        Close any persistent connections held open to the OSDF server.
+        """
+        self._request.close()
+
+    async def _get_json(self, url, document_type):
+        osdf_response = await self._request.get(url)
+
+        if osdf_response["code"] != 200:
+            headers = osdf_response['headers']
+            self._header_error(headers, 'retrieve', document_type)
+
+        return json.loads(osdf_response['content'].decode('utf-8'))
+
+    async def edit_node(self, json_data):
+        """
+        Updates a node with the provided data
+        """
+        # Get the node id from json_data
+        if 'id' not in json_data:
+            raise Exception("No node id in the provided JSON.")
+
+        node_id = json_data['id']
+
+        json_str = json.dumps(json_data)
+
+        osdf_response = await self._request.put("/nodes/" + node_id, json_str)
+
+        if osdf_response["code"] != 200:
+            headers = osdf_response['headers']
+            self._header_error(headers, 'edit', 'node')
+
+    async def get_info(self):
+        """
+        Retrieve's the OSDF server's information/contact document
+        """
+        osdf_response = await self._request.get("/info")
+
+        return json.loads(osdf_response['content'].decode('utf-8'))
+
+    async def get_node(self, node_id):
+        """
+        Retrieves an OSDF node given the node's ID
+
+        Returns the parsed form of the JSON document for the node
+        """
+        return await self._get_json("/nodes/" + node_id, 'node')
+
+    async def get_nodes(self, node_ids, ordered=True):
+        """
+        Retrieves many OSDF nodes concurrently. Each element of node_ids is
+        either a node ID, or a (node ID, version) tuple.
+
+        Returns an async iterator of (node_id, node, error) tuples, in the
+        same order as node_ids unless ordered is False.
+        """
+        async def fetch(node_id):
+            """ Retrieves a single node, by version if one was provided. """
+            try:
+                if isinstance(node_id, tuple):
+                    node = await self.get_node_by_version(*node_id)
+                else:
+                    node = await self.get_node(node_id)
+            except Exception as err:
+                return (node_id, None, err)
+
+            return (node_id, node, None)
+
+        tasks = [asyncio.ensure_future(fetch(node_id)) for node_id in node_ids]
+
+        try:
+            if ordered:
+                for task in tasks:
+                    yield await task
+            else:
+                for task in asyncio.as_completed(tasks):
+                    yield await task
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def get_nodes_in(self, node_id):
+        """
+        Retrieves the nodes that link to the OSDF node identified by the
+        given the node ID.
+        """
+        return await self._get_json("/nodes/{}/in".format(node_id), 'node')
+
+    async def get_nodes_out(self, node_id):
+        """
+        Retrieves the OSDF nodes that the given node links to (via it's linkage
+        field).
+        """
+        return await self._get_json("/nodes/{}/out".format(node_id), 'node')
+
+    async def get_node_by_version(self, node_id, version):
+        """
+        Given a numerical version number, retrieves an OSDF node's data
+        as it was at that version.
+
+        Returns the parsed form of the JSON document for the node
+        """
+        url = "/nodes/%s/ver/%s" % (node_id, version)
+
+        return await self._get_json(url, 'node')
+
+    async def get_schemas(self, namespace):
+        """
+        Retrieves all of the schemas for a particular namespace.
+        """
+        url = '/namespaces/%s/schemas/' % namespace
+
+        return await self._get_json(url, 'schemas')
+
+    async def get_schema(self, namespace, schema_name):
+        """
+        Retrieves a namespace's document schema
+
+        Returns the parsed form of the JSON-Schema document
+        """
+        url = '/namespaces/%s/schemas/%s' % (namespace, schema_name)
+
+        return await self._get_json(url, 'schema')
+
+    async def get_aux_schemas(self, namespace):
+        """
+        Retrieves all of the auxiliary schemas for a particular namespace.
+
+        Returns the parsed form of the auxiliary schemas.
+        """
+        url = '/namespaces/%s/schemas/aux/' % (namespace)
+
+        return await self._get_json(url, 'aux schemas')
+
+    async def get_aux_schema(self, namespace, aux_schema_name):
+        """
+        Retrieves an auxiliary schema
+
+        Returns the parsed form of the auxiliary schema JSON
+        """
+        url = '/namespaces/%s/schemas/aux/%s' % (namespace, aux_schema_name)
+
+        return await self._get_json(url, 'aux schema')
+
+    async def insert_node(self, json_data):
+        """
+        Inserts a node with the provided data into OSDF
+
+        Returns the node ID upon successful insertion.
+        """
+        json_str = json.dumps(json_data)
+
+        osdf_response = await self._request.post("/nodes", json_str)
+        node_id = None
+
+        headers = osdf_response["headers"]
+
+        if osdf_response["code"] == 201:
+            if 'location' in headers:
+                node_id = headers['location'].split('/')[-1]
+            else:
+                raise Exception("No location header for the newly inserted node.")
+        else:
+            if 'x-osdf-error' in headers:
+                msg = "Unable to insert node document. Reason: " + headers['x-osdf-error']
+            else:
+                msg = "Unable to insert node document."
+
+            raise Exception(msg)
+
+        return node_id
+
+    async def delete_node(self, node_id):
+        """
+        Deletes the specified node from OSDF.
+        """
+        osdf_response = await self._request.delete("/nodes/" + node_id)
+
+        if osdf_response['code'] != 204:
+            headers = osdf_response['headers']
+            self._header_error(headers, 'delete', 'node')
+
+    async def validate_node(self, json_data):
+        """
+        Report whether a node document validates against OSDF and its notion
+        of what that node should look like according to any registered schemas.
+
+        Returns a tuple with the first value holding a boolean of whether the
+        document validated or not. The second value contains the error message
+        if the document did not validate.
+        """
+        json_str = json.dumps(json_data)
+        url = "/nodes/validate"
+
+        osdf_response = await self._request.post(url, json_str)
+        headers = osdf_response["headers"]
+        valid = False
+
+        error_msg = None
+
+        if osdf_response["code"] != 200:
+            if 'x-osdf-error' in headers:
+                error_msg = headers['x-osdf-error']
+            else:
+                error_msg = "Unknown"
+        else:
+            valid = True
+
+        return (valid, error_msg)
+
+    async def _query_page(self, url, namespace, query):
+        osdf_response = await self._request.post(url, query)
+
+        if osdf_response["code"] != 200 and osdf_response["code"] != 206:
+            headers = osdf_response["headers"]
+
+            if 'x-osdf-error' in headers:
+                msg = "Unable to query namespace %s. Reason: %s" \
+                     % (namespace, headers['x-osdf-error'])
+            else:
+                msg = "Unable to query namespace."
+
+            raise Exception(msg)
+
+        return json.loads(osdf_response['content'].decode('utf-8'))
+
+    async def oql_query(self, namespace, query, page=1):
+        """
+        Issue an OSDF Query Language (OQL) query against OSDF.
+
+        Returns the specified page of results.
+        """
+        url = "/nodes/oql/%s/page/%s" % (namespace, str(page))
+
+        return await self._query_page(url, namespace, query)
+
+    async def query(self, namespace, query, page=1):
+        """
+        Issue a query against OSDF. Queries are expressed in JSON form using
+        the ElasticSearch Query DSL.
+
+        Returns the specified page of results.
+        """
+        url = "/nodes/query/%s/page/%s" % (namespace, str(page))
+
+        return await self._query_page(url, namespace, query)
+
+    async def _pages(self, page_getter, namespace, query, prefetch=4):
+        """
+        Async generator of successive pages of query results. Once the first
+        page reveals the page size and total number of hits, up to prefetch
+        of the remaining pages are requested concurrently. Pages are always
+        yielded in order.
+        """
+        page = 1
+        results = await page_getter(namespace, query, page)
+
+        total = results.get('search_result_total')
+        page_size = results['result_count']
+        retrieved = page_size
+        more_results = page_size > 0
+
+        yield results
+
+        if more_results and total is not None and prefetch > 1:
+            last_page = -(-total // page_size)
+            pending = []
+
+            try:
+                while more_results and (pending or page < last_page):
+                    while page < last_page and len(pending) < prefetch:
+                        page += 1
+                        pending.append(asyncio.ensure_future(
+                            page_getter(namespace, query, page)
+                        ))
+
+                    results = await pending.pop(0)
+
+                    retrieved += results['result_count']
+                    more_results = results['result_count'] > 0
+
+                    yield results
+            finally:
+                for task in pending:
+                    task.cancel()
+
+        # Without a known total (or prefetching), request one page at a time.
+        while more_results and (total is None or retrieved < total):
+            page += 1
+            results = await page_getter(namespace, query, page)
+
+            retrieved += results['result_count']
+            more_results = results['result_count'] > 0
+
+            yield results
+
+    async def _iter_results(self, page_getter, namespace, query, prefetch=4):
+        async for results in self._pages(page_getter, namespace, query,
+                                         prefetch):
+            for document in results['results']:
+                yield document
+
+    async def _all_pages(self, page_getter, namespace, query, prefetch=4):
+        cumulative_results = []
+
+        async for results in self._pages(page_getter, namespace, query,
+                                         prefetch):
+            cumulative_results.extend(results['results'])
+
+        results['results'] = cumulative_results
+        results['result_count'] = len(results['results'])
+        del results['page']
+
+        return results
+
+    def iter_oql_query(self, namespace, query, prefetch=4):
+        """
+        Issue an OSDF Query Language (OQL) query against OSDF, and return an
+        async iterator over ALL the results, one document at a time.
+        """
+        return self._iter_results(self.oql_query, namespace, query, prefetch)
+
+    def iter_query(self, namespace, query, prefetch=4):
+        """
+        Issue a query against OSDF, and return an async iterator over ALL the
+        results, one document at a time.
+        """
+        return self._iter_results(self.query, namespace, query, prefetch)
+
+    async def oql_query_all_pages(self, namespace, query, prefetch=4):
+        """
+        Issue an OSDF Query Language (OQL) query against OSDF, as in the
+        oql_query() method, but retrieves ALL results by aggregating all
+        the available pages of results.
+        """
+        return await self._all_pages(self.oql_query, namespace, query,
+                                     prefetch)
+
+    async def query_all_pages(self, namespace, query, prefetch=4):
+        """
+        Issue a query against OSDF, as in the query() method, but retrieves
+        ALL results by aggregating all the available pages of results.
+        """
+        return await self._all_pages(self.query, namespace, query, prefetch)
+
+    def create_osdf_node(self, namespace, node_type, domain_json, linkage=None,
+                         read="all", write="all"):
+        """
+        Create an OSDF compliant skeletal node document.
+        """
+        if not linkage:
+            linkage = {}
+
+        node_json = {
+            'ns': namespace,
+            'acl': {'read': [read], 'write': [write]},
+            'linkage': linkage,
+            'meta': domain_json,
+            'node_type': node_type
+        }
+
+        return node_json
+
+    def _header_error(self, headers=None, method_type='retrieve',
+                      document_type=None):
+        """
+        Raise an exception, potentially using information from HTTP headers.
+        """
+        if not headers:
+            headers = []
+
+        if 'x-osdf-error' in headers:
+            msg = "Unable to %s %s document. Reason: %s" \
+                % (method_type, document_type, headers['x-osdf-error'])
+        else:
+            msg = "Unable to %s %s document." \
+                % (method_type, document_type)
+
+        raise Exception(msg)
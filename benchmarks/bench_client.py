@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+
+"""
+Benchmark of the client against the in-process stand-in OSDF server (see
+standin.py). Measures the throughput, the 50th and 99th percentile latency
+of the individual requests, and the peak memory use of single node
+retrievals, concurrent retrievals, bulk inserts, paginated scans (of whole
+documents, and of their IDs alone) and traversals. Each scenario runs in a
+forked child process so that its peak memory usage can be measured
+independently.
+"""
+
+#pylint:disable=protected-access,broad-except
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from osdf import OSDF
+from standin import StandInServer
+
+NAMESPACE = "test"
+
+TREE_TYPES = ["study", "subject", "visit", "sample", "prep", "seq_set"]
+
+def percentile(values, fraction):
+    """ Returns the value at the given fraction of the sorted values. """
+    if not values:
+        return 0
+
+    values = sorted(values)
+    index = min(len(values) - 1, int(fraction * len(values)))
+
+    return values[index]
+
+def single_gets(client, server, args):
+    """ Retrieves nodes one after the other. """
+    node_ids = server.node_ids[:args.operations]
+    errors = 0
+
+    for node_id in node_ids:
+        try:
+            client.get_node(node_id)
+        except Exception:
+            errors += 1
+
+    return (len(node_ids), errors)
+
+def concurrent_gets(client, server, args):
+    """ Retrieves nodes with get_nodes(). """
+    node_ids = server.node_ids[:args.operations]
+
+    results = client.get_nodes(node_ids, max_workers=args.workers or None,
+                               ordered=False)
+
+    errors = len([error for (_, _, error) in results if error is not None])
+
+    return (len(node_ids), errors)
+
+def bulk_inserts(client, server, args):
+    """ Inserts new nodes with insert_nodes(). """
+    documents = (server.make_node(NAMESPACE, "example")
+                 for _ in range(args.operations))
+
+    results = client.insert_nodes(documents, concurrency=args.workers or None,
+                                  ordered=False)
+    errors = len([error for (_, _, error) in results if error is not None])
+
+    return (args.operations, errors)
+
+def paginated_scan(client, _, args):
+    """ Iterates over every node of the namespace with iter_query(). """
+    count = 0
+    query = json.dumps({"query": {"match_all": {}}})
+
+    for _ in client.iter_query(NAMESPACE, query, prefetch=args.workers or 8):
+        count += 1
+
+    return (count, 0)
+
+def projected_scan(client, _, args):
+    """ As paginated_scan(), but only retrieves the IDs of the nodes. """
+    count = 0
+    query = json.dumps({"query": {"match_all": {}}})
+
+    for _ in client.iter_query(NAMESPACE, query, prefetch=args.workers or 8,
+                               fields=["id"]):
+        count += 1
+
+    return (count, 0)
+
+def traversal(client, server, args):
+    """ Walks the whole tree of nodes under the root with traverse(). """
+    count = 0
+
+    walk = client.traverse(server.root_id, direction='in',
+                           max_workers=args.workers or None)
+
+    for _ in walk:
+        count += 1
+
+    return (count, len(walk.errors))
+
+SCENARIOS = [
+    ("single gets", single_gets),
+    ("concurrent gets", concurrent_gets),
+    ("bulk inserts", bulk_inserts),
+    ("paginated scan", paginated_scan),
+    ("projected scan", projected_scan),
+    ("traversal", traversal)
+]
+
+def run(scenario, server, args):
+    """
+    Runs a scenario in a child process, returning the number of items it
+    processed, how many of them failed, the wall clock seconds it took, the
+    latencies of its requests in milliseconds, and the peak resident memory
+    of the child in kilobytes.
+    """
+    (read_fd, write_fd) = os.pipe()
+    pid = os.fork()
+
+    if pid == 0:
+        os.close(read_fd)
+
+        client = OSDF("127.0.0.1", "user", "password", port=server.port,
+                      pool_size=args.workers or 32)
+        latencies = []
+        client.metrics.add_listener(
+            lambda record: latencies.append(record['latency'] * 1000)
+        )
+
+        started = time.time()
+        (items, errors) = scenario(client, server, args)
+        elapsed = time.time() - started
+
+        with os.fdopen(write_fd, 'w') as output:
+            json.dump([items, errors, elapsed, latencies], output)
+
+        os._exit(0)
+
+    os.close(write_fd)
+
+    with os.fdopen(read_fd) as result:
+        (items, errors, elapsed, latencies) = json.load(result)
+
+    (_, _, usage) = os.wait4(pid, 0)
+
+    return (items, errors, elapsed, latencies, usage.ru_maxrss)
+
+def main():
+    """ Runs the benchmarks and prints the results. """
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('-n', '--nodes', type=int, default=2000,
+                        help='Nodes in the namespace for scans.')
+    parser.add_argument('-o', '--operations', type=int, default=500,
+                        help='Nodes retrieved or inserted by the other ' + \
+                             'scenarios.')
+    parser.add_argument('-l', '--latency', type=float, default=2,
+                        help='Milliseconds the server delays responses by.')
+    parser.add_argument('-f', '--fields', type=int, default=10,
+                        help='Metadata fields per node.')
+    parser.add_argument('-w', '--workers', type=int, default=8,
+                        help='Concurrency of the bulk operations, or 0 ' + \
+                             'to let the client adapt it (up to 32).')
+    parser.add_argument('--page-size', type=int, default=100,
+                        help='Query results per page.')
+    parser.add_argument('--fanout', type=int, default=3,
+                        help='Children per node of the traversed tree.')
+    parser.add_argument('--gzip', action='store_true',
+                        help='Have the server compress responses.')
+    parser.add_argument('--capacity', type=int,
+                        help='Concurrent requests the server handles ' + \
+                             'before responding with 503 errors.')
+    parser.add_argument('-s', '--scenario', action='append',
+                        choices=[name for (name, _) in SCENARIOS],
+                        help='Scenario to run (default: all). Repeatable.')
+    args = parser.parse_args()
+
+    server = StandInServer(latency=args.latency / 1000.0,
+                           page_size=args.page_size, meta_fields=args.fields,
+                           compress=args.gzip, capacity=args.capacity)
+    server.node_ids = server.populate(NAMESPACE, args.nodes)
+    server.root_id = server.populate_tree("tree", args.fanout, TREE_TYPES)
+    server.start()
+
+    print("{} nodes, {} fields each, {} ms latency, {} workers".format(
+        args.nodes, args.fields, args.latency, args.workers
+    ))
+    print("{:<16} {:>8} {:>7} {:>10} {:>9} {:>9} {:>12}".format(
+        "scenario", "items", "errors", "items/s", "p50 ms", "p99 ms",
+        "peak RSS KB"
+    ))
+
+    for (name, scenario) in SCENARIOS:
+        if args.scenario and name not in args.scenario:
+            continue
+
+        (items, errors, elapsed, latencies, peak) = run(scenario, server,
+                                                        args)
+
+        print("{:<16} {:>8} {:>7} {:>10.1f} {:>9.2f} {:>9.2f} {:>12}".format(
+            name, items, errors, items / elapsed, percentile(latencies, 0.5),
+            percentile(latencies, 0.99), peak
+        ))
+
+    server.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+
+"""
+Benchmark for decoding large pages of query results. Compares the original
+approach of parsing the JSON and then recursively converting every string
+(_byteify), with the single-pass decoding used by the client, with
+leaving strings as unicode, and with lazily decoding only the id and
+node_type of each result. Each approach runs in a forked child process so
+that its peak memory usage can be measured independently.
+"""
+
+#pylint:disable=undefined-variable
+
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from osdf import OSDF
+
+def byteify(input_str):
+    """ The recursive conversion previously applied to every response. """
+    #pylint: disable=no-else-return
+    if isinstance(input_str, dict):
+        return {byteify(key):byteify(value) for key, value in input_str.iteritems()}
+    elif isinstance(input_str, list):
+        return [byteify(element) for element in input_str]
+    elif isinstance(input_str, unicode):
+        return input_str.encode('utf-8')
+    else:
+        return input_str
+
+def make_page(documents, fields):
+    """ Builds the JSON text of a page of query results. """
+    node = {
+        "id": "0123456789abcdef0123456789abcdef",
+        "ns": "test",
+        "ver": 1,
+        "node_type": "sample",
+        "acl": {"read": ["all"], "write": ["all"]},
+        "linkage": {"collected_during": ["0123456789abcdef0123456789abcd00"]},
+        "meta": dict(("field%d" % i, u"value \u00e9 %d" % i) for i in range(fields))
+    }
+
+    page = {
+        "page": 1,
+        "result_count": documents,
+        "search_result_total": documents,
+        "results": [node] * documents
+    }
+
+    return json.dumps(page)
+
+def measure(decoder, content, rounds):
+    """
+    Runs the decoder in a child process and returns the CPU seconds per
+    decode and the peak resident memory of the child in kilobytes.
+    """
+    pid = os.fork()
+
+    if pid == 0:
+        for _ in range(rounds):
+            decoder(content)
+        os._exit(0) #pylint: disable=protected-access
+
+    (_, _, usage) = os.wait4(pid, 0)
+
+    cpu = (usage.ru_utime + usage.ru_stime) / rounds
+
+    return (cpu, usage.ru_maxrss)
+
+def main():
+    """ Runs the benchmark and prints the results. """
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('-d', '--documents', type=int, default=5000,
+                        help='Documents per page of results.')
+    parser.add_argument('-f', '--fields', type=int, default=30,
+                        help='Metadata fields per document.')
+    parser.add_argument('-r', '--rounds', type=int, default=5,
+                        help='Times to decode the page.')
+    args = parser.parse_args()
+
+    content = make_page(args.documents, args.fields)
+
+    bytes_client = OSDF("localhost", "user", "password", pool_size=0)
+    unicode_client = OSDF("localhost", "user", "password", pool_size=0,
+                          unicode_strings=True)
+    lazy_client = OSDF("localhost", "user", "password", pool_size=0,
+                       lazy_results=True)
+
+    def lazy_scan(content):
+        """ Reads only a couple of fields from each lazily decoded result. """
+        results = lazy_client._decode_results(content) #pylint: disable=protected-access
+
+        for document in results['results']:
+            (document['id'], document['node_type'])
+
+    decoders = [
+        ("json.loads + _byteify", lambda content: byteify(json.loads(content))),
+        ("single pass (default)", bytes_client._decode), #pylint: disable=protected-access
+        ("unicode_strings=True", unicode_client._decode), #pylint: disable=protected-access
+        ("lazy_results=True", lazy_scan)
+    ]
+
+    baseline = measure(lambda content: None, content, 1)
+
+    print("Page of {} documents, {} bytes".format(args.documents, len(content)))
+    print("{:<24} {:>14} {:>20}".format("decoder", "CPU s/page", "peak RSS delta (KB)"))
+
+    for (name, decoder) in decoders:
+        (cpu, peak) = measure(decoder, content, args.rounds)
+        print("{:<24} {:>14.3f} {:>20}".format(name, cpu, peak - baseline[1]))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,549 @@
+#!/usr/bin/env python
+
+"""
+An in-process stand-in for an OSDF server, for measuring the client without
+a live server. Nodes are kept in memory. Every response can be delayed by a
+fixed latency, and generated nodes carry a configurable amount of metadata.
+
+It implements enough of the OSDF REST interface for the client:
+
+    GET    /info
+    POST   /nodes
+    GET    /nodes/{id}
+    PUT    /nodes/{id}
+    DELETE /nodes/{id}
+    GET    /nodes/{id}/ver/{ver}
+    GET    /nodes/{id}/in
+    GET    /nodes/{id}/out
+    POST   /nodes/query/{ns}/page/{page}
+    POST   /nodes/oql/{ns}/page/{page}
+    POST   /nodes/validate
+    GET    /namespaces/{ns}/schemas/[{name}]
+    GET    /namespaces/{ns}/schemas/aux/[{name}]
+
+Queries are not interpreted, beyond an ElasticSearch term query on
+node_type: every other query matches all the nodes of the namespace. The
+_source filtering of ElasticSearch queries is honored.
+"""
+
+import BaseHTTPServer
+import SocketServer
+import argparse
+import json
+import re
+import socket
+import threading
+import time
+import uuid
+import zlib
+
+REQUIRED_KEYS = ('ns', 'acl', 'linkage', 'node_type', 'meta')
+
+_ROUTES = []
+
+def _route(method, pattern):
+    """ Registers a handler method for requests matching the pattern. """
+    def register(func):
+        """ Adds the handler to the routing table. """
+        _ROUTES.append((method, re.compile("^" + pattern + "$"), func))
+        return func
+
+    return register
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """
+    Handles requests to the stand-in server. The server object holds the
+    data.
+    """
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args): #pylint: disable=arguments-differ
+        pass
+
+    def setup(self):
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def _send(self, code, body="", headers=None):
+        headers = dict(headers or {})
+        accepted = self.headers.get('accept-encoding', '')
+
+        if body and self.server.compress and 'gzip' in accepted:
+            compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            body = compressor.compress(body) + compressor.flush()
+            headers['Content-Encoding'] = 'gzip'
+
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        # Write the response in one go so that it is not held up by Nagle's
+        # algorithm.
+        lines = ["%s %d %s" % (self.protocol_version, code,
+                               self.responses.get(code, ("",))[0])]
+        headers['Content-Length'] = str(len(body))
+
+        for (name, value) in headers.items():
+            lines.append("%s: %s" % (name, value))
+
+        self.wfile.write("\r\n".join(lines) + "\r\n\r\n" + body)
+
+    def _error(self, code, message):
+        self._send(code, "", {'X-OSDF-Error': message})
+
+    def _body(self):
+        length = int(self.headers.get('content-length', 0))
+        body = self.rfile.read(length)
+
+        if self.headers.get('content-encoding') == 'gzip':
+            body = zlib.decompress(body, 16 + zlib.MAX_WBITS)
+
+        return body
+
+    def _dispatch(self, method):
+        path = self.path.split('?', 1)[0]
+
+        if not self.server.admit():
+            self._body()
+            return self._error(503, "Server overloaded.")
+
+        try:
+            self._handle(method, path)
+        finally:
+            self.server.leave()
+
+    def _handle(self, method, path):
+        for (route_method, pattern, func) in _ROUTES:
+            match = pattern.match(path)
+
+            if route_method == method and match:
+                try:
+                    func(self, *match.groups())
+                except ValueError as err:
+                    self._error(422, str(err))
+
+                return
+
+        self._error(404, "No such resource.")
+
+    def do_GET(self): #pylint: disable=invalid-name
+        self._dispatch('GET')
+
+    def do_POST(self): #pylint: disable=invalid-name
+        self._dispatch('POST')
+
+    def do_PUT(self): #pylint: disable=invalid-name
+        self._dispatch('PUT')
+
+    def do_DELETE(self): #pylint: disable=invalid-name
+        self._dispatch('DELETE')
+
+    @_route('GET', r'/info')
+    def info(self):
+        """ The server's information document. """
+        self._send(200, json.dumps(self.server.info))
+
+    @_route('POST', r'/nodes')
+    def insert(self):
+        """ Inserts a new node. """
+        node_id = self.server.insert(_parse_node(self._body()))
+        location = "http://%s:%d/nodes/%s" % (self.server.server_address[0],
+                                              self.server.server_address[1],
+                                              node_id)
+        self._send(201, "", {'Location': location})
+
+    @_route('GET', r'/nodes/([^/]+)')
+    def get(self, node_id):
+        """ Retrieves the latest version of a node. """
+        content = self.server.get(node_id)
+
+        if content is None:
+            return self._error(404, "No such node.")
+
+        self._send(200, content)
+
+    @_route('PUT', r'/nodes/([^/]+)')
+    def edit(self, node_id):
+        """ Replaces a node with a new version. """
+        if not self.server.edit(node_id, _parse_node(self._body())):
+            return self._error(404, "No such node.")
+
+        self._send(200)
+
+    @_route('DELETE', r'/nodes/([^/]+)')
+    def delete(self, node_id):
+        """ Deletes a node and its history. """
+        if not self.server.delete(node_id):
+            return self._error(404, "No such node.")
+
+        self._send(204)
+
+    @_route('GET', r'/nodes/([^/]+)/ver/(\d+)')
+    def get_version(self, node_id, version):
+        """ Retrieves a node as it was at a version. """
+        content = self.server.get(node_id, int(version))
+
+        if content is None:
+            return self._error(404, "No such node version.")
+
+        self._send(200, content)
+
+    @_route('GET', r'/nodes/([^/]+)/(in|out)')
+    def linked(self, node_id, direction):
+        """ Retrieves the nodes linking to, or linked from, a node. """
+        documents = self.server.linked(node_id, direction)
+
+        if documents is None:
+            return self._error(404, "No such node.")
+
+        self._send(200, _page(documents, 1, len(documents)))
+
+    @_route('POST', r'/nodes/(query|oql)/([^/]+)/page/(\d+)')
+    def query(self, language, namespace, page):
+        """ Returns a page of query results. """
+        query = self._body()
+        documents = self.server.search(namespace, query)
+        page = int(page)
+        size = self.server.page_size
+        results = documents[(page - 1) * size:page * size]
+
+        if language == 'query':
+            results = _source_filter(results, query)
+
+        if page * size < len(documents):
+            code = 206
+        else:
+            code = 200
+
+        self._send(code, _page(results, page, len(documents)))
+
+    @_route('POST', r'/nodes/validate')
+    def validate(self):
+        """ Checks that a document has the structure of a node. """
+        _parse_node(self._body())
+        self._send(200)
+
+    @_route('GET', r'/namespaces/([^/]+)/schemas/(aux/)?([^/]*)')
+    def schemas(self, _, aux, name):
+        """ Retrieves all, or one, of a namespace's (auxiliary) schemas. """
+        if aux:
+            collection = self.server.aux_schemas
+        else:
+            collection = self.server.schemas
+
+        if not name:
+            return self._send(200, json.dumps(collection))
+
+        if name not in collection:
+            return self._error(404, "No such schema.")
+
+        self._send(200, json.dumps(collection[name]))
+
+def _parse_node(body):
+    """ Parses a node document, checking it has the required keys. """
+    document = json.loads(body)
+
+    for key in REQUIRED_KEYS:
+        if key not in document:
+            raise ValueError("Node document is missing '%s'." % key)
+
+    return document
+
+def _page(documents, page, total):
+    """ Builds the JSON text of a page of results from node JSON texts. """
+    return '{"page": %d, "result_count": %d, "search_result_total": %d, ' \
+        '"results": [%s]}' % (page, len(documents), total, ",".join(documents))
+
+def _source_filter(documents, query):
+    """
+    Trims node JSON texts to the fields listed in the _source of an
+    ElasticSearch query, if any.
+    """
+    try:
+        fields = json.loads(query)['_source']
+    except (ValueError, KeyError, TypeError):
+        return documents
+
+    filtered = []
+
+    for text in documents:
+        document = json.loads(text)
+        selected = {}
+
+        for field in fields:
+            keys = field.split('.')
+            value = document
+
+            try:
+                for key in keys:
+                    value = value[key]
+            except (KeyError, TypeError):
+                continue
+
+            target = selected
+
+            for key in keys[:-1]:
+                target = target.setdefault(key, {})
+
+            target[keys[-1]] = value
+
+        filtered.append(json.dumps(selected))
+
+    return filtered
+
+class StandInServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """
+    A stand-in OSDF server listening on localhost. A port of 0 picks a free
+    port. Every response is delayed by latency seconds. Query results are
+    returned page_size nodes per page. Nodes created with populate() have
+    meta_fields metadata fields, each holding a value of field_size
+    characters. Responses are gzip compressed if compress is True and the
+    client accepts it. If a capacity is given, requests beyond that many at
+    once are turned away with a 503 (Service Unavailable) status.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, port=0, latency=0, page_size=100, meta_fields=10,
+                 field_size=20, compress=False, capacity=None):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', port), _Handler)
+
+        self.latency = latency
+        self.page_size = page_size
+        self.meta_fields = meta_fields
+        self.field_size = field_size
+        self.compress = compress
+        self.capacity = capacity
+        self.rejected = 0
+        self._active = 0
+
+        self.info = {
+            "title": "OSDF stand-in",
+            "description": "In-process stand-in OSDF server.",
+            "admin_contact_email1": "", "admin_contact_email2": "",
+            "technical_contact1": "", "technical_contact2": ""
+        }
+        self.schemas = {
+            "example": {
+                "type": "object",
+                "properties": {"meta": {"$ref": "meta"}}
+            }
+        }
+        self.aux_schemas = {"meta": {"type": "object"}}
+
+        self._lock = threading.Lock()
+        # Node ID to the list of the JSON texts of each version
+        self._versions = {}
+        # Node ID to the parsed latest version
+        self._nodes = {}
+        # Node ID to the set of IDs of the nodes linking to it
+        self._linked_in = {}
+        self._thread = None
+
+    @property
+    def port(self):
+        """ The port the server is listening on. """
+        return self.server_address[1]
+
+    def start(self):
+        """ Serves requests in a background thread. """
+        self._thread = threading.Thread(target=self.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+
+        return self
+
+    def stop(self):
+        """ Stops serving requests. """
+        self.shutdown()
+        self.server_close()
+
+    def admit(self):
+        """ Counts a request in, unless the server is at capacity. """
+        with self._lock:
+            if self.capacity is not None and self._active >= self.capacity:
+                self.rejected += 1
+                return False
+
+            self._active += 1
+
+        return True
+
+    def leave(self):
+        """ Counts a request out. """
+        with self._lock:
+            self._active -= 1
+
+    def _store(self, node_id, document):
+        old = self._nodes.get(node_id)
+
+        if old is not None:
+            for targets in old['linkage'].values():
+                for target in targets:
+                    self._linked_in.get(target, set()).discard(node_id)
+
+        for targets in document['linkage'].values():
+            for target in targets:
+                self._linked_in.setdefault(target, set()).add(node_id)
+
+        self._nodes[node_id] = document
+        self._versions.setdefault(node_id, []).append(json.dumps(document))
+
+    def insert(self, document):
+        """ Adds a node, returning its new ID. """
+        node_id = uuid.uuid4().hex
+        document = dict(document, id=node_id, ver=1)
+
+        with self._lock:
+            self._store(node_id, document)
+
+        return node_id
+
+    def edit(self, node_id, document):
+        """ Stores a new version of a node. """
+        with self._lock:
+            if node_id not in self._nodes:
+                return False
+
+            version = self._nodes[node_id]['ver'] + 1
+            self._store(node_id, dict(document, id=node_id, ver=version))
+
+        return True
+
+    def delete(self, node_id):
+        """ Removes a node and its history. """
+        with self._lock:
+            document = self._nodes.pop(node_id, None)
+
+            if document is None:
+                return False
+
+            del self._versions[node_id]
+
+            for targets in document['linkage'].values():
+                for target in targets:
+                    self._linked_in.get(target, set()).discard(node_id)
+
+        return True
+
+    def get(self, node_id, version=None):
+        """ Returns the JSON text of a node, or of one of its versions. """
+        with self._lock:
+            versions = self._versions.get(node_id)
+
+            if versions is None:
+                return None
+
+            if version is None:
+                return versions[-1]
+
+            if 1 <= version <= len(versions):
+                return versions[version - 1]
+
+        return None
+
+    def linked(self, node_id, direction):
+        """ Returns the JSON texts of the nodes linked to or from a node. """
+        with self._lock:
+            document = self._nodes.get(node_id)
+
+            if document is None:
+                return None
+
+            if direction == 'in':
+                node_ids = sorted(self._linked_in.get(node_id, ()))
+            else:
+                node_ids = [target for targets in document['linkage'].values()
+                            for target in targets]
+
+            return [self._versions[linked_id][-1] for linked_id in node_ids
+                    if linked_id in self._versions]
+
+    def search(self, namespace, query):
+        """ Returns the JSON texts of the nodes matching a query. """
+        node_type = None
+
+        try:
+            node_type = json.loads(query)['query']['term']['node_type']
+        except (ValueError, KeyError, TypeError):
+            pass
+
+        with self._lock:
+            return [self._versions[node_id][-1]
+                    for (node_id, document) in sorted(self._nodes.items())
+                    if document['ns'] == namespace and \
+                        (node_type is None or document['node_type'] == node_type)]
+
+    def make_node(self, namespace, node_type, linkage=None):
+        """ Generates a node document with the configured metadata size. """
+        value = "x" * self.field_size
+
+        return {
+            "ns": namespace,
+            "node_type": node_type,
+            "acl": {"read": ["all"], "write": ["all"]},
+            "linkage": linkage or {},
+            "meta": dict(("field%d" % i, value)
+                         for i in range(self.meta_fields))
+        }
+
+    def populate(self, namespace, count, node_type="example", linkage=None):
+        """ Adds count generated nodes, returning their IDs. """
+        return [self.insert(self.make_node(namespace, node_type, linkage))
+                for _ in range(count)]
+
+    def populate_tree(self, namespace, fanout, node_types):
+        """
+        Adds a hierarchy of nodes, as with a study linked to by subjects,
+        which are linked to by visits, and so on. The root is of the first
+        node type, and each node is linked to by fanout nodes of the next
+        type. Returns the ID of the root.
+        """
+        root_id = self.insert(self.make_node(namespace, node_types[0]))
+        parents = [root_id]
+
+        for node_type in node_types[1:]:
+            children = []
+
+            for parent_id in parents:
+                children.extend(self.populate(namespace, fanout, node_type,
+                                              {"linked_to": [parent_id]}))
+
+            parents = children
+
+        return root_id
+
+def main():
+    """ Runs the stand-in server until interrupted. """
+    parser = argparse.ArgumentParser(description=__doc__.strip(),
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-p', '--port', type=int, default=8123,
+                        help='Port to listen on.')
+    parser.add_argument('-l', '--latency', type=float, default=0,
+                        help='Milliseconds to delay every response by.')
+    parser.add_argument('-n', '--nodes', type=int, default=0,
+                        help='Generated nodes to add to the "test" namespace.')
+    parser.add_argument('-f', '--fields', type=int, default=10,
+                        help='Metadata fields per generated node.')
+    parser.add_argument('--page-size', type=int, default=100,
+                        help='Query results per page.')
+    parser.add_argument('--gzip', action='store_true',
+                        help='Compress responses.')
+    parser.add_argument('--capacity', type=int,
+                        help='Concurrent requests to serve before ' + \
+                             'responding with 503 errors.')
+    args = parser.parse_args()
+
+    server = StandInServer(args.port, args.latency / 1000.0, args.page_size,
+                           args.fields, compress=args.gzip,
+                           capacity=args.capacity)
+    server.populate("test", args.nodes)
+
+    print("Listening on 127.0.0.1:%d" % server.port)
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,340 @@
+"""
+Caching support for the Python OSDF client.
+"""
+
+import collections
+import json
+import sqlite3
+import threading
+import time
+
+class LRUCache(object):
+    """
+    A thread-safe, size-bounded, least-recently-used cache. If a ttl (in
+    seconds) is provided, entries also expire that long after being stored.
+    Entries may be stored with a tag, so that all those sharing it can be
+    discarded at once. Counts of cache hits and misses are kept for
+    inspection.
+    """
+
+    def __init__(self, maxsize=1000, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+        self._entries = collections.OrderedDict()
+        # Tag to the set of keys of the entries stored with it
+        self._tagged = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        """
+        Retrieve the value cached under key, or default if there is no such
+        entry or it has expired.
+        """
+        with self._lock:
+            entry = self._entries.pop(key, None)
+
+            if entry is not None:
+                (value, expires, _) = entry
+
+                if expires is None or expires > time.time():
+                    # Re-insert to mark it as the most recently used entry
+                    self._entries[key] = entry
+                    self.hits += 1
+                    return value
+
+                self._untag(key, entry)
+
+            self.misses += 1
+
+        return default
+
+    def _untag(self, key, entry):
+        """
+        Forget the tag of an entry that has been removed. The lock must be
+        held.
+        """
+        tag = entry[2]
+
+        if tag is not None:
+            keys = self._tagged[tag]
+            keys.discard(key)
+
+            if not keys:
+                del self._tagged[tag]
+
+    def _pop(self, key):
+        """
+        Remove the entry for key, if there is one. The lock must be held.
+        """
+        entry = self._entries.pop(key, None)
+
+        if entry is not None:
+            self._untag(key, entry)
+
+    def set(self, key, value, tag=None):
+        """
+        Store a value under key, and optionally a tag, evicting the least
+        recently used entry if the cache is full.
+        """
+        if self.maxsize <= 0:
+            return
+
+        if self.ttl is None:
+            expires = None
+        else:
+            expires = time.time() + self.ttl
+
+        with self._lock:
+            self._pop(key)
+            self._entries[key] = (value, expires, tag)
+
+            if tag is not None:
+                self._tagged.setdefault(tag, set()).add(key)
+
+            while len(self._entries) > self.maxsize:
+                self._untag(*self._entries.popitem(last=False))
+
+    def discard(self, key):
+        """
+        Remove the entry for key, if there is one.
+        """
+        with self._lock:
+            self._pop(key)
+
+    def discard_where(self, predicate):
+        """
+        Remove every entry whose key satisfies the given predicate.
+        """
+        with self._lock:
+            for key in [key for key in self._entries if predicate(key)]:
+                self._pop(key)
+
+    def discard_tagged(self, tag):
+        """
+        Remove every entry stored with the given tag.
+        """
+        with self._lock:
+            for key in self._tagged.pop(tag, ()):
+                del self._entries[key]
+
+    def tags(self):
+        """
+        Return a list of the tags of the entries in the cache.
+        """
+        with self._lock:
+            return list(self._tagged)
+
+    def clear(self):
+        """
+        Remove all entries and reset the hit and miss counters.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._tagged.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """
+        Return a dictionary with the hits, misses and current size of the
+        cache.
+        """
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self._entries),
+            'maxsize': self.maxsize
+        }
+
+_DISK_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    expires REAL,
+    used REAL NOT NULL,
+    tag TEXT
+);
+
+CREATE INDEX IF NOT EXISTS entries_used ON entries (used);
+CREATE INDEX IF NOT EXISTS entries_tag ON entries (tag);
+"""
+
+class DiskCache(object):
+    """
+    A size-bounded, least-recently-used cache kept in an SQLite database
+    file, so that it can be shared by several processes, and outlives them.
+    It offers the same interface as LRUCache, but only holds strings, under
+    keys, and with tags, that are tuples of strings and numbers. Tags are
+    indexed, so discarding the entries with a tag takes a single statement.
+    If a ttl (in seconds) is
+    provided, entries expire that long after being stored. Counts of cache
+    hits and misses are kept for inspection, by each process.
+    """
+
+    def __init__(self, path, maxsize=1000, ttl=None):
+        self.path = path
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, timeout=30,
+                                           check_same_thread=False)
+        self._connection.text_factory = str
+        self._connection.executescript(_DISK_SCHEMA)
+
+    def __len__(self):
+        with self._lock:
+            return self._connection.execute(
+                "SELECT COUNT(*) FROM entries"
+            ).fetchone()[0]
+
+    def get(self, key, default=None):
+        """
+        Retrieve the value cached under key, or default if there is no such
+        entry or it has expired.
+        """
+        key = json.dumps(key)
+        now = time.time()
+
+        with self._lock:
+            with self._connection:
+                row = self._connection.execute(
+                    "SELECT value FROM entries WHERE key = ? AND " + \
+                    "(expires IS NULL OR expires > ?)", (key, now)
+                ).fetchone()
+
+                if row is not None:
+                    # Mark it as the most recently used entry
+                    self._connection.execute(
+                        "UPDATE entries SET used = ? WHERE key = ?",
+                        (now, key)
+                    )
+                    self.hits += 1
+                    return row[0]
+
+            self.misses += 1
+
+        return default
+
+    def set(self, key, value, tag=None):
+        """
+        Store a value under key, and optionally a tag, evicting the least
+        recently used entries, and any that have expired, if the cache is
+        full.
+        """
+        if self.maxsize <= 0:
+            return
+
+        now = time.time()
+
+        if self.ttl is None:
+            expires = None
+        else:
+            expires = now + self.ttl
+
+        if tag is not None:
+            tag = json.dumps(tag)
+
+        with self._lock:
+            with self._connection:
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO entries (key, value, expires, " + \
+                    "used, tag) VALUES (?, ?, ?, ?, ?)",
+                    (json.dumps(key), value, expires, now, tag)
+                )
+
+                count = self._connection.execute(
+                    "SELECT COUNT(*) FROM entries"
+                ).fetchone()[0]
+
+                if count > self.maxsize:
+                    self._connection.execute(
+                        "DELETE FROM entries WHERE expires <= ?", (now,)
+                    )
+                    self._connection.execute(
+                        "DELETE FROM entries WHERE key IN (SELECT key " + \
+                        "FROM entries ORDER BY used DESC LIMIT -1 OFFSET ?)",
+                        (self.maxsize,)
+                    )
+
+    def discard(self, key):
+        """
+        Remove the entry for key, if there is one.
+        """
+        with self._lock:
+            with self._connection:
+                self._connection.execute("DELETE FROM entries WHERE key = ?",
+                                         (json.dumps(key),))
+
+    def discard_where(self, predicate):
+        """
+        Remove every entry whose key satisfies the given predicate.
+        """
+        with self._lock:
+            with self._connection:
+                keys = [row[0] for row in self._connection.execute(
+                    "SELECT key FROM entries"
+                ).fetchall()]
+
+                self._connection.executemany(
+                    "DELETE FROM entries WHERE key = ?",
+                    [(key,) for key in keys if predicate(tuple(json.loads(key)))]
+                )
+
+    def discard_tagged(self, tag):
+        """
+        Remove every entry stored with the given tag.
+        """
+        with self._lock:
+            with self._connection:
+                self._connection.execute("DELETE FROM entries WHERE tag = ?",
+                                         (json.dumps(tag),))
+
+    def tags(self):
+        """
+        Return a list of the tags of the entries in the cache.
+        """
+        with self._lock:
+            return [tuple(json.loads(row[0])) for row in
+                    self._connection.execute(
+                        "SELECT DISTINCT tag FROM entries " + \
+                        "WHERE tag IS NOT NULL"
+                    ).fetchall()]
+
+    def clear(self):
+        """
+        Remove all entries and reset the hit and miss counters.
+        """
+        with self._lock:
+            with self._connection:
+                self._connection.execute("DELETE FROM entries")
+
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """
+        Return a dictionary with the hits, misses and current size of the
+        cache.
+        """
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self),
+            'maxsize': self.maxsize
+        }
+
+    def close(self):
+        """
+        Close the cache's database file.
+        """
+        with self._lock:
+            self._connection.close()
@@ -0,0 +1,273 @@
+"""
+Lazily decoded, read-only views of JSON documents returned by OSDF.
+"""
+
+import json
+import re
+
+try:
+    from collections.abc import Mapping, Sequence
+except ImportError:
+    from collections import Mapping, Sequence
+
+# Used to find where each JSON value ends. The C accelerated scanner is far
+# quicker at this than anything that could be written in Python, and values
+# it decodes along the way are discarded immediately.
+_DECODER = json.JSONDecoder()
+
+scanstring = json.decoder.scanstring #pylint: disable=invalid-name
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_WHITESPACE_CHARS = ' \t\n\r'
+
+def _skip_whitespace(content, pos, match=_WHITESPACE.match):
+    return match(content, pos).end()
+
+def _scan(content, start, make_child=None):
+    """
+    Scans the JSON object or array starting at the given position, without
+    keeping any of its values. Returns a tuple of a list of the (key,
+    value_start, value_end, child) entries of the container, where key is the
+    raw JSON text of the key (or None for arrays), and the position just past
+    the container.
+
+    If make_child is provided, it is called to create a lazy view of each
+    object or array value, which is scanned in turn to find where the value
+    ends, and stored as the entry's child. Otherwise the ends of values are
+    found with the C accelerated JSON scanner.
+    """
+    scan_once = _DECODER.scan_once
+    skip = _WHITESPACE.match
+    is_object = content[start] == '{'
+    closing = '}' if is_object else ']'
+    entries = []
+
+    pos = _skip_whitespace(content, start + 1)
+
+    if content[pos:pos + 1] == closing:
+        return (entries, pos + 1)
+
+    try:
+        while True:
+            key = None
+            child = None
+
+            if is_object:
+                if content[pos] != '"':
+                    raise ValueError("Expecting property name at %d." % pos)
+
+                (_, key_end) = scanstring(content, pos + 1)
+                key = content[pos:key_end]
+                pos = key_end
+
+                if content[pos] in _WHITESPACE_CHARS:
+                    pos = skip(content, pos).end()
+
+                if content[pos] != ':':
+                    raise ValueError("Expecting ':' delimiter at %d." % pos)
+
+                pos += 1
+
+                if content[pos] in _WHITESPACE_CHARS:
+                    pos = skip(content, pos).end()
+
+            if make_child is not None and content[pos] in '{[':
+                child = make_child(pos)
+                value_end = child.end()
+            else:
+                (_, value_end) = scan_once(content, pos)
+
+            entries.append((key, pos, value_end, child))
+
+            pos = value_end
+
+            if content[pos] in _WHITESPACE_CHARS:
+                pos = skip(content, pos).end()
+
+            if content[pos] == ',':
+                pos += 1
+
+                if content[pos] in _WHITESPACE_CHARS:
+                    pos = skip(content, pos).end()
+            elif content[pos] == closing:
+                return (entries, pos + 1)
+            else:
+                raise ValueError("Expecting ',' delimiter at %d." % pos)
+    except (IndexError, StopIteration):
+        raise ValueError("Invalid JSON container at position %d." % start)
+
+class _LazyContainer(object):
+    """
+    Behavior shared by lazy objects and arrays: locating the values in the
+    raw JSON text and decoding them the first time they are needed.
+    """
+
+    def __init__(self, content, start=0, decoder=json.loads,
+                 scan_children=True, keys=None):
+        self._content = content
+        self._start = _skip_whitespace(content, start)
+        self._decoder = decoder
+        self._scan_children = scan_children
+        self._entries = None
+        self._end = None
+
+        # Decoded keys, shared with all the containers nested in this one
+        # since the same keys tend to appear over and over.
+        if keys is None:
+            keys = {}
+
+        self._keys = keys
+
+    def _make_child(self, start):
+        if self._content[start] == '{':
+            cls = LazyDocument
+        else:
+            cls = LazyList
+
+        return cls(self._content, start, self._decoder, False, self._keys)
+
+    def _index(self):
+        if self._entries is None:
+            # Only the outermost container scans its nested objects and
+            # arrays itself. Deeper levels are skipped over with the C
+            # scanner, which is much quicker.
+            if self._scan_children:
+                make_child = self._make_child
+            else:
+                make_child = None
+
+            (self._entries, self._end) = _scan(self._content, self._start,
+                                               make_child)
+
+        return self._entries
+
+    def _decode_key(self, raw_key):
+        key = self._keys.get(raw_key)
+
+        if key is None:
+            key = self._decoder(raw_key)
+            self._keys[raw_key] = key
+
+        return key
+
+    def _value(self, position):
+        (_, value_start, value_end, child) = self._index()[position]
+
+        if child is not None:
+            return child
+
+        if self._content[value_start] in '{[':
+            return self._make_child(value_start)
+
+        return self._decoder(self._content[value_start:value_end])
+
+    def end(self):
+        """
+        Return the position in the raw JSON text just past the end of this
+        object or array.
+        """
+        self._index()
+
+        return self._end
+
+    def raw(self):
+        """
+        Return the raw JSON text of this object or array.
+        """
+        return self._content[self._start:self.end()]
+
+    def materialize(self):
+        """
+        Fully decode this object or array into ordinary dicts and lists.
+        """
+        return self._decoder(self.raw())
+
+class LazyDocument(_LazyContainer, Mapping):
+    """
+    A read-only mapping over the raw JSON text of an object. The text is
+    only scanned to find the keys when the document is first used, and each
+    value is decoded the first time it is accessed. Values that are objects
+    or arrays are themselves lazy. Use materialize() to obtain a plain dict.
+    """
+
+    def __init__(self, content, start=0, decoder=json.loads,
+                 scan_children=True, keys=None):
+        super(LazyDocument, self).__init__(content, start, decoder,
+                                           scan_children, keys)
+        self._positions = None
+        self._values = {}
+
+    def _key_positions(self):
+        if self._positions is None:
+            positions = {}
+
+            for (position, entry) in enumerate(self._index()):
+                positions[self._decode_key(entry[0])] = position
+
+            self._positions = positions
+
+        return self._positions
+
+    def __getitem__(self, key):
+        if key not in self._values:
+            position = self._key_positions()[key]
+            self._values[key] = self._value(position)
+
+        return self._values[key]
+
+    def __iter__(self):
+        # Keys are returned in the order they appear in the document
+        for entry in self._index():
+            yield self._decode_key(entry[0])
+
+    def __len__(self):
+        return len(self._key_positions())
+
+    def __contains__(self, key):
+        return key in self._key_positions()
+
+    def __repr__(self):
+        return "LazyDocument(%s)" % ", ".join([repr(key) for key in self])
+
+class LazyList(_LazyContainer, Sequence):
+    """
+    A read-only sequence over the raw JSON text of an array. Each element is
+    decoded when it is accessed, and elements that are objects or arrays are
+    themselves lazy. Elements are not kept once decoded, so iterating over a
+    large array does not accumulate memory. Use materialize() to obtain a
+    plain list.
+    """
+
+    def __getitem__(self, index):
+        entries = self._index()
+
+        if isinstance(index, slice):
+            return [self[position]
+                    for position in range(*index.indices(len(entries)))]
+
+        if index < 0:
+            index += len(entries)
+
+        return self._value(index)
+
+    def __len__(self):
+        return len(self._index())
+
+    def __eq__(self, other):
+        if not isinstance(other, Sequence) or isinstance(other, str):
+            return NotImplemented
+
+        return len(self) == len(other) and list(self) == list(other)
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+
+        if equal is NotImplemented:
+            return equal
+
+        return not equal
+
+    __hash__ = None
+
+    def __repr__(self):
+        return "LazyList(%d items)" % len(self)
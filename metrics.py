@@ -0,0 +1,245 @@
+"""
+Instrumentation of the requests made by the Python OSDF client.
+"""
+
+import re
+import threading
+
+# Upper bounds, in milliseconds, of the buckets of the latency histograms.
+# The last bucket holds everything slower.
+LATENCY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000,
+                   10000, float('inf'))
+
+# Resource paths and the endpoint templates they are reported under. The
+# first match wins.
+_ENDPOINTS = [
+    (re.compile(r'^/nodes/query/[^/]+/page/[^/]+$'),
+     '/nodes/query/{ns}/page/{page}'),
+    (re.compile(r'^/nodes/oql/[^/]+/page/[^/]+$'),
+     '/nodes/oql/{ns}/page/{page}'),
+    (re.compile(r'^/nodes/validate$'), '/nodes/validate'),
+    (re.compile(r'^/nodes$'), '/nodes'),
+    (re.compile(r'^/nodes/[^/]+/ver/[^/]+$'), '/nodes/{id}/ver/{ver}'),
+    (re.compile(r'^/nodes/[^/]+/in$'), '/nodes/{id}/in'),
+    (re.compile(r'^/nodes/[^/]+/out$'), '/nodes/{id}/out'),
+    (re.compile(r'^/nodes/[^/]+$'), '/nodes/{id}'),
+    (re.compile(r'^/namespaces/[^/]+/schemas/aux/?$'),
+     '/namespaces/{ns}/schemas/aux/'),
+    (re.compile(r'^/namespaces/[^/]+/schemas/aux/[^/]+$'),
+     '/namespaces/{ns}/schemas/aux/{name}'),
+    (re.compile(r'^/namespaces/[^/]+/schemas/?$'),
+     '/namespaces/{ns}/schemas/'),
+    (re.compile(r'^/namespaces/[^/]+/schemas/[^/]+$'),
+     '/namespaces/{ns}/schemas/{name}')
+]
+
+def endpoint_template(resource):
+    """
+    Convert a resource path, such as /nodes/abc123/out, into the template
+    of the endpoint it belongs to, such as /nodes/{id}/out, so that requests
+    for different nodes are counted together.
+    """
+    path = resource.split('?', 1)[0]
+
+    for (pattern, template) in _ENDPOINTS:
+        if pattern.match(path):
+            return template
+
+    return path
+
+def _new_stats():
+    return {
+        'count': 0,
+        'errors': 0,
+        'statuses': {},
+        'latency_total': 0.0,
+        'latency_max': 0.0,
+        'histogram': [0] * len(LATENCY_BUCKETS),
+        'bytes_sent': 0,
+        'bytes_received': 0,
+        'decode_count': 0,
+        'decode_total': 0.0
+    }
+
+def _percentile(histogram, count, fraction):
+    """
+    Estimates a latency percentile (in milliseconds) from a histogram, as
+    the upper bound of the bucket it falls in.
+    """
+    if count == 0:
+        return None
+
+    rank = fraction * count
+    seen = 0
+
+    for (bound, bucket_count) in zip(LATENCY_BUCKETS, histogram):
+        seen += bucket_count
+
+        if seen >= rank:
+            return bound
+
+    return LATENCY_BUCKETS[-1]
+
+class Metrics(object):
+    """
+    A thread-safe collector of per-endpoint request statistics: counts of
+    requests, failures and response statuses, latency totals and
+    histograms, bytes transferred and the time spent decoding responses.
+
+    Callables added with add_listener() are also called with a dictionary
+    describing each request as it completes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints = {}
+        self._listeners = []
+
+    def add_listener(self, listener):
+        """
+        Register a callable to receive a dictionary with the method,
+        endpoint, status, latency (in seconds), bytes_sent and bytes_received
+        of every request.
+        """
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener):
+        """
+        Stop sending request details to a previously added listener.
+        """
+        self._listeners.remove(listener)
+
+    def _stats(self, method, endpoint):
+        key = (method, endpoint)
+        stats = self._endpoints.get(key)
+
+        if stats is None:
+            stats = _new_stats()
+            self._endpoints[key] = stats
+
+        return stats
+
+    def record_request(self, method, endpoint, status, latency, bytes_sent,
+                       bytes_received):
+        """
+        Record a completed request. The status is None if no response was
+        received.
+        """
+        millis = latency * 1000
+
+        with self._lock:
+            stats = self._stats(method, endpoint)
+            stats['count'] += 1
+
+            if status is None or status >= 400:
+                stats['errors'] += 1
+
+            stats['statuses'][status] = stats['statuses'].get(status, 0) + 1
+            stats['latency_total'] += latency
+            stats['latency_max'] = max(stats['latency_max'], latency)
+            stats['bytes_sent'] += bytes_sent
+            stats['bytes_received'] += bytes_received
+
+            for (position, bound) in enumerate(LATENCY_BUCKETS):
+                if millis <= bound:
+                    stats['histogram'][position] += 1
+                    break
+
+        if self._listeners:
+            record = {
+                'method': method,
+                'endpoint': endpoint,
+                'status': status,
+                'latency': latency,
+                'bytes_sent': bytes_sent,
+                'bytes_received': bytes_received
+            }
+
+            for listener in list(self._listeners):
+                listener(record)
+
+    def record_decode(self, method, endpoint, seconds):
+        """
+        Record the time taken to decode a response from an endpoint.
+        """
+        with self._lock:
+            stats = self._stats(method, endpoint)
+            stats['decode_count'] += 1
+            stats['decode_total'] += seconds
+
+    def reset(self):
+        """
+        Discard all the statistics collected so far.
+        """
+        with self._lock:
+            self._endpoints = {}
+
+    def snapshot(self):
+        """
+        Return the statistics collected so far, as a dictionary keyed by
+        "METHOD endpoint" strings. Besides the raw counts, totals and the
+        latency histogram, each entry holds the mean latency, and estimated
+        50th and 99th percentile latencies, in milliseconds.
+        """
+        snapshot = {}
+
+        with self._lock:
+            for ((method, endpoint), stats) in self._endpoints.items():
+                entry = dict(stats)
+                entry['statuses'] = dict(stats['statuses'])
+                entry['histogram'] = list(stats['histogram'])
+                count = stats['count']
+
+                if count:
+                    entry['latency_mean'] = \
+                        stats['latency_total'] * 1000 / count
+                else:
+                    entry['latency_mean'] = None
+
+                entry['latency_p50'] = _percentile(stats['histogram'], count,
+                                                   0.5)
+                entry['latency_p99'] = _percentile(stats['histogram'], count,
+                                                   0.99)
+
+                snapshot["%s %s" % (method, endpoint)] = entry
+
+        return snapshot
+
+    def summary(self):
+        """
+        Return a human readable table summarizing the statistics per
+        endpoint.
+        """
+        snapshot = self.snapshot()
+
+        lines = ["%-45s %7s %6s %9s %9s %9s %11s %11s %9s" % (
+            "endpoint", "calls", "errors", "mean ms", "p50 ms", "p99 ms",
+            "sent", "received", "decode ms"
+        )]
+
+        for name in sorted(snapshot):
+            entry = snapshot[name]
+
+            if entry['latency_mean'] is None:
+                mean = "-"
+            else:
+                mean = "%.1f" % entry['latency_mean']
+
+            lines.append("%-45s %7d %6d %9s %9s %9s %11d %11d %9.1f" % (
+                name, entry['count'], entry['errors'], mean,
+                _format_bound(entry['latency_p50']),
+                _format_bound(entry['latency_p99']),
+                entry['bytes_sent'], entry['bytes_received'],
+                entry['decode_total'] * 1000
+            ))
+
+        return "\n".join(lines)
+
+def _format_bound(bound):
+    if bound is None:
+        return "-"
+
+    if bound == float('inf'):
+        return ">%d" % LATENCY_BUCKETS[-2]
+
+    return "<=%d" % bound
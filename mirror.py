@@ -0,0 +1,256 @@
+"""
+Local SQLite mirrors of OSDF namespaces.
+"""
+
+import json
+import sqlite3
+import threading
+import time
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS info (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+
+CREATE TABLE IF NOT EXISTS nodes (
+    id TEXT PRIMARY KEY,
+    node_type TEXT NOT NULL,
+    ver INTEGER,
+    document TEXT NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS nodes_node_type ON nodes (node_type);
+CREATE INDEX IF NOT EXISTS nodes_ver ON nodes (ver);
+
+CREATE TABLE IF NOT EXISTS links (
+    source TEXT NOT NULL,
+    linkage TEXT NOT NULL,
+    target TEXT NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS links_source ON links (source);
+CREATE INDEX IF NOT EXISTS links_target ON links (target);
+"""
+
+class NamespaceMirror(object):
+    """
+    A copy of the nodes of a single OSDF namespace kept in an SQLite
+    database file, indexed by node ID, node type, version and linkage
+    target. Documents are stored as their JSON text. The mirror may be
+    shared between threads.
+
+    A mirror is filled and kept up to date by attaching it to an OSDF
+    client and calling refresh_mirror() on the client.
+    """
+
+    def __init__(self, path, namespace):
+        self.path = path
+        self.namespace = namespace
+
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.text_factory = str
+        self._connection.executescript(_SCHEMA)
+
+        mirrored = self._get_info('namespace')
+
+        if mirrored is None:
+            self._set_info('namespace', namespace)
+            self._connection.commit()
+        elif mirrored != namespace:
+            self._connection.close()
+            raise ValueError("Mirror %s holds namespace %s, not %s." % \
+                             (path, mirrored, namespace))
+
+    def _get_info(self, key):
+        row = self._connection.execute("SELECT value FROM info WHERE key = ?",
+                                       (key,)).fetchone()
+
+        if row is None:
+            return None
+
+        return row[0]
+
+    def _set_info(self, key, value):
+        self._connection.execute(
+            "INSERT OR REPLACE INTO info (key, value) VALUES (?, ?)",
+            (key, value)
+        )
+
+    @property
+    def refreshed(self):
+        """
+        Retrieve the time (in seconds since the epoch) the mirror was last
+        refreshed, or None if it never has been.
+        """
+        with self._lock:
+            value = self._get_info('refreshed')
+
+        if value is None:
+            return None
+
+        return float(value)
+
+    def mark_refreshed(self, when=None):
+        """
+        Record the time the mirror was refreshed, defaulting to now.
+        """
+        if when is None:
+            when = time.time()
+
+        with self._lock:
+            self._set_info('refreshed', repr(when))
+            self._connection.commit()
+
+    def mark_stale(self):
+        """
+        Forget when the mirror was refreshed, as it may no longer hold the
+        whole namespace.
+        """
+        with self._lock:
+            self._connection.execute("DELETE FROM info WHERE key = ?",
+                                     ('refreshed',))
+            self._connection.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._connection.execute(
+                "SELECT COUNT(*) FROM nodes"
+            ).fetchone()[0]
+
+    def get(self, node_id):
+        """
+        Retrieve the JSON text of a node, or None if it is not in the mirror.
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT document FROM nodes WHERE id = ?", (node_id,)
+            ).fetchone()
+
+        if row is None:
+            return None
+
+        return row[0]
+
+    def __contains__(self, node_id):
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT 1 FROM nodes WHERE id = ?", (node_id,)
+            ).fetchone()
+
+        return row is not None
+
+    def versions(self):
+        """
+        Retrieve a dictionary of the version of every node in the mirror,
+        keyed by node ID.
+        """
+        with self._lock:
+            return dict(self._connection.execute("SELECT id, ver FROM nodes"))
+
+    def linked_out(self, node_id):
+        """
+        Retrieve the JSON text of the nodes the given node links to.
+        """
+        with self._lock:
+            return [row[0] for row in self._connection.execute(
+                "SELECT document FROM nodes WHERE id IN " + \
+                "(SELECT target FROM links WHERE source = ?) ORDER BY id",
+                (node_id,)
+            ).fetchall()]
+
+    def has_targets(self, node_id):
+        """
+        Whether every node the given node links to is in the mirror. Nodes
+        in other namespaces, or not yet copied, never are.
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT 1 FROM links WHERE source = ? AND target NOT IN " + \
+                "(SELECT id FROM nodes) LIMIT 1", (node_id,)
+            ).fetchone()
+
+        return row is None
+
+    def linked_in(self, node_id):
+        """
+        Retrieve the JSON text of the nodes that link to the given node.
+        """
+        with self._lock:
+            return [row[0] for row in self._connection.execute(
+                "SELECT document FROM nodes WHERE id IN " + \
+                "(SELECT source FROM links WHERE target = ?) ORDER BY id",
+                (node_id,)
+            ).fetchall()]
+
+    def of_type(self, node_type):
+        """
+        Retrieve the JSON text of every node of the given type.
+        """
+        with self._lock:
+            return [row[0] for row in self._connection.execute(
+                "SELECT document FROM nodes WHERE node_type = ? ORDER BY id",
+                (node_type,)
+            ).fetchall()]
+
+    def store(self, documents):
+        """
+        Add, or replace, nodes in the mirror from their JSON text. Nodes of
+        other namespaces are ignored. Returns the number of nodes stored.
+        """
+        nodes = []
+        links = []
+
+        for content in documents:
+            document = json.loads(content)
+
+            if document.get('ns') != self.namespace:
+                continue
+
+            node_id = document['id']
+            nodes.append((node_id, document['node_type'],
+                          document.get('ver'), content))
+
+            for (linkage, targets) in document.get('linkage', {}).items():
+                for target in targets:
+                    links.append((node_id, linkage, target))
+
+        with self._lock:
+            with self._connection:
+                self._connection.executemany(
+                    "DELETE FROM links WHERE source = ?",
+                    [(node[0],) for node in nodes]
+                )
+                self._connection.executemany(
+                    "INSERT OR REPLACE INTO nodes (id, node_type, ver, " + \
+                    "document) VALUES (?, ?, ?, ?)", nodes
+                )
+                self._connection.executemany(
+                    "INSERT INTO links (source, linkage, target) " + \
+                    "VALUES (?, ?, ?)", links
+                )
+
+        return len(nodes)
+
+    def remove(self, node_ids):
+        """
+        Remove nodes from the mirror.
+        """
+        params = [(node_id,) for node_id in node_ids]
+
+        with self._lock:
+            with self._connection:
+                self._connection.executemany(
+                    "DELETE FROM links WHERE source = ?", params
+                )
+                self._connection.executemany(
+                    "DELETE FROM nodes WHERE id = ?", params
+                )
+
+    def close(self):
+        """
+        Close the mirror's database file.
+        """
+        with self._lock:
+            self._connection.close()
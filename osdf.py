@@ -2,8 +2,112 @@
 Python OSDF client module.
 """
 
+import copy
+import hashlib
+import itertools
 import json
-from request import HttpRequest
+import time
+import archive
+from cache import LRUCache
+from lazy import LazyDocument, LazyList
+from metrics import Metrics, endpoint_template
+from mirror import NamespaceMirror
+from request import ConnectionPool, HTTPStatusException, HttpRequest
+from traversal import Traversal
+import workers
+
+# The methods a query cache must offer
+_QUERY_CACHE_METHODS = ('get', 'set', 'discard_tagged', 'tags', 'stats')
+
+def _utf8_list(items):
+    """
+    Converts the text in a parsed JSON array to UTF-8 encoded strings. Any
+    objects in the array have already been converted by _utf8_object().
+    """
+    #pylint: disable=undefined-variable
+    converted = []
+
+    for item in items:
+        if isinstance(item, unicode):
+            item = item.encode('utf-8')
+        elif isinstance(item, list):
+            item = _utf8_list(item)
+
+        converted.append(item)
+
+    return converted
+
+def _utf8_object(pairs):
+    """
+    A json object_pairs_hook that builds each JSON object with its keys and
+    text values converted to UTF-8 encoded strings.
+    """
+    #pylint: disable=undefined-variable
+    obj = {}
+
+    for (key, value) in pairs:
+        if isinstance(value, unicode):
+            value = value.encode('utf-8')
+        elif isinstance(value, list):
+            value = _utf8_list(value)
+
+        # Keys repeat across documents, so share a single copy of each.
+        obj[intern(key.encode('utf-8'))] = value
+
+    return obj
+
+def _canonical_hash(document):
+    """
+    Computes a hash of the content of a node document that does not depend
+    on the order of its keys, the representation of its strings, or its
+    version number.
+    """
+    content = dict((key, value) for (key, value) in document.items()
+                   if key != 'ver')
+    canonical = json.dumps(content, sort_keys=True, separators=(',', ':'))
+
+    return hashlib.sha1(canonical).hexdigest()
+
+def _source_filtered(query, fields):
+    """
+    Adds ElasticSearch source filtering to a query, in JSON text, so that
+    only the given fields of the matching documents are returned.
+    """
+    body = json.loads(query)
+    body['_source'] = list(fields)
+
+    return json.dumps(body)
+
+def _project(document, fields):
+    """
+    Builds a copy of a node document holding only the given fields, which
+    may be dotted paths to nested fields, such as "meta.subtype". Nested
+    fields keep their place in the document's structure, as they do with
+    ElasticSearch source filtering. Missing fields are left out.
+    """
+    projected = {}
+
+    for field in fields:
+        keys = field.split('.')
+        value = document
+
+        try:
+            for key in keys:
+                value = value[key]
+        except (KeyError, TypeError):
+            continue
+
+        if isinstance(value, (LazyDocument, LazyList)):
+            value = value.materialize()
+
+        target = projected
+
+        for key in keys[:-1]:
+            target = target.setdefault(key, {})
+
+        target[keys[-1]] = value
+
+    return projected
 
 class OSDF(object):
     """
@@ -11,18 +115,219 @@ class OSDF(object):
     operations (node creation, deletion, queries, etc.)
     """
 
-    def __init__(self, server, username, password, port=8123, ssl=False):
+    def __init__(self, server, username, password, port=8123, ssl=False,
+                 pool_size=10, cache_size=0, cache_ttl=30, schema_ttl=None,
+                 unicode_strings=False, lazy_results=False,
+                 compress_threshold=None, mirror=None, max_concurrency=None,
+                 query_cache=None):
         self._server = server
         self._port = port
         self._username = username
         self._password = password
         self._ssl = ssl
+        self._pool_size = pool_size
+        self._pool = None
+        self._unicode_strings = unicode_strings
+        self._lazy_results = lazy_results
+
+        # Node documents larger than this many bytes are sent compressed.
+        self._compress_threshold = compress_threshold
+
+        # Node versions never change, so they can be kept until evicted.
+        # Current nodes are only kept for cache_ttl seconds.
+        self._version_cache = LRUCache(cache_size)
+        self._node_cache = LRUCache(cache_size, ttl=cache_ttl)
+
+        # Schemas are revalidated with the server once they are older than
+        # schema_ttl seconds. A schema_ttl of None disables schema caching.
+        self._schema_ttl = schema_ttl
+        self._schema_cache = LRUCache(1000)
+        self._validators = {}
+
+        # An optional NamespaceMirror that nodes are read from before
+        # resorting to the server.
+        self._mirror = mirror
+
+        # An optional LRUCache, DiskCache or other cache offering the same
+        # methods, of the raw pages of query results. Its keys include the
+        # server and user, so it may be shared between clients, and is kept
+        # when they change.
+        self._query_cache = query_cache
+
+        # Request statistics are kept across changes of server or user.
+        self._metrics = Metrics()
+
+        # Bulk operations share a limit on the requests they have in flight,
+        # which adapts to how the server copes. Left unset, it is capped at
+        # the number of pooled connections.
+        if max_concurrency is None:
+            max_concurrency = pool_size or 8
+
+        self._controller = workers.ConcurrencyController(
+            maximum=max_concurrency
+        )
+
         self._set_request()
 
     def _set_request(self):
+        # Cached documents may not be valid for a different server or user.
+        self._version_cache.clear()
+        self._node_cache.clear()
+        self._schema_cache.clear()
+        self._validators = {}
+
+        # Persistent connections are only shareable while the endpoint stays
+        # the same. If the server, port or SSL setting has changed, discard
+        # the old pool and start a new one.
+        key = (self._server, self._port, self._ssl)
+
+        if self._pool is not None and self._pool.key != key:
+            self._pool.close()
+            self._pool = None
+
+        if self._pool is None and self._pool_size:
+            self._pool = ConnectionPool(self._server, self._port, self._ssl,
+                                        maxsize=self._pool_size)
+
         self._request = HttpRequest(self._server, self._username,
                                     self._password, self._port,
-                                    self._ssl)
+                                    self._ssl, pool=self._pool,
+                                    compress_threshold=self._compress_threshold,
+                                    metrics=self._metrics)
+
+    def close(self):
+        """
+        Close any persistent connections held open to the OSDF server.
+        """
+        if self._pool is not None:
+            self._pool.close()
+            self._pool = None
+            self._set_request()
+
+    def cache_stats(self):
+        """
+        Retrieve the hit and miss counts, and the sizes, of the node, node
+        version and schema caches, and of the query cache if there is one.
+        """
+        stats = {
+            'node': self._node_cache.stats(),
+            'version': self._version_cache.stats(),
+            'schema': self._schema_cache.stats()
+        }
+
+        if self._query_cache is not None:
+            stats['query'] = self._query_cache.stats()
+
+        return stats
+
+    @property
+    def metrics(self):
+        """
+        Retrieve the Metrics object recording the client's requests, to add
+        listeners or reset the statistics.
+        """
+        return self._metrics
+
+    def request_stats(self):
+        """
+        Retrieve per-endpoint statistics of the requests made by the client:
+        counts of calls, errors and statuses, latencies (with a histogram),
+        bytes sent and received, and time spent decoding responses.
+        """
+        return self._metrics.snapshot()
+
+    @property
+    def controller(self):
+        """
+        Retrieve the ConcurrencyController shared by the client's bulk
+        operations. It adapts the number of requests in flight to the
+        server's responsiveness, up to an operation's concurrency or
+        max_workers if provided, and retries those that fail because the
+        server is overloaded, except insertions. Input is consumed lazily.
+        """
+        return self._controller
+
+    def concurrency_stats(self):
+        """
+        Retrieve the current limit on concurrent requests made by bulk
+        operations, the number in flight, and the baseline latencies of the
+        running operations, used to judge whether the server is coping.
+        """
+        return self._controller.stats()
+
+    def _imap(self, func, items, max_workers=None, ordered=True,
+              idempotent=True, window=None):
+        """
+        Applies func to items concurrently, as in workers.imap(), under the
+        client's shared concurrency controller. Unless max_workers is given,
+        the controller alone decides how many calls are made at once.
+        """
+        if max_workers is None:
+            max_workers = self._controller.maximum
+
+        return workers.imap(func, items, max_workers, ordered,
+                            self._controller, idempotent, window)
+
+    def transfer_stats(self):
+        """
+        Retrieve the number of bytes of request and response bodies exchanged
+        with the server, both as transferred over the network and after
+        decompression, to gauge the savings from compression.
+        """
+        return self._request.stats
+
+    @property
+    def mirror(self):
+        """
+        Retrieve the local namespace mirror the client reads nodes from, if
+        any.
+        """
+        return self._mirror
+
+    @mirror.setter
+    def mirror(self, mirror):
+        if mirror is not None and not isinstance(mirror, NamespaceMirror):
+            raise ValueError("Invalid value for mirror.")
+
+        self._mirror = mirror
+
+    @property
+    def query_cache(self):
+        """
+        Retrieve the cache of query results, if any.
+        """
+        return self._query_cache
+
+    @query_cache.setter
+    def query_cache(self, query_cache):
+        # Any object with the methods of the caches will do.
+        if query_cache is not None and \
+                not all([callable(getattr(query_cache, method, None))
+                         for method in _QUERY_CACHE_METHODS]):
+            raise ValueError("Invalid value for query_cache.")
+
+        self._query_cache = query_cache
+
+    def _invalidate_queries(self, namespace=None):
+        """
+        Discards the cached query results of a namespace of the server, or
+        of all its namespaces if none is given, as a write may have changed
+        them.
+        """
+        if self._query_cache is None:
+            return
+
+        endpoint = (self._server, self._port)
+
+        # Results are tagged with the server and namespace they came from.
+        if namespace is None:
+            tags = [tag for tag in self._query_cache.tags()
+                    if tuple(tag[:2]) == endpoint]
+        else:
+            tags = [endpoint + (namespace,)]
+
+        for tag in tags:
+            self._query_cache.discard_tagged(tag)
 
     @property
     def server(self):
@@ -106,20 +411,145 @@ class OSDF(object):
 
         osdf_response = self._request.put("/nodes/" + node_id, json_str)
 
+        self._node_cache.discard(node_id)
+        self._invalidate_queries(json_data.get('ns'))
+
         if osdf_response["code"] != 200:
             headers = osdf_response['headers']
-            self._header_error(headers, 'edit', 'node')
-
-    def _byteify(self, input_str):
-        #pylint: disable=no-else-return,undefined-variable
-        if isinstance(input_str, dict):
-            return {self._byteify(key):self._byteify(value) for key, value in input_str.iteritems()}
-        elif isinstance(input_str, list):
-            return [self._byteify(element) for element in input_str]
-        elif isinstance(input_str, unicode):
-            return input_str.encode('utf-8')
-        else:
-            return input_str
+            self._header_error(headers, 'edit', 'node',
+                               osdf_response['code'])
+
+        self._mirror_written(node_id)
+
+    def _mirror_written(self, node_id):
+        """
+        Reads a node written through the client into the mirror, so that a
+        refreshed mirror still holds the whole namespace. If the node cannot
+        be read, the mirror is marked stale until its next refresh.
+        """
+        if self._mirror is None:
+            return
+
+        # The node may have moved to another namespace, which the mirror
+        # ignores when storing it.
+        self._mirror.remove([node_id])
+
+        try:
+            content = self._retrieve_node(node_id)
+        except Exception:
+            self._mirror.mark_stale()
+            return
+
+        self._mirror.store([content])
+
+    def _timed(self, decoder, content, endpoint):
+        """
+        Decodes content with the given decoder, recording the time taken
+        against the (method, url) endpoint it came from.
+        """
+        started = time.time()
+        data = decoder(content)
+
+        (method, url) = endpoint
+        self._metrics.record_decode(method, endpoint_template(url),
+                                    time.time() - started)
+
+        return data
+
+    def edit_nodes(self, documents, concurrency=None, current=None):
+        """
+        Updates many nodes concurrently, skipping documents that only differ
+        from the current node in version. The current node is taken from
+        current, a mapping of node IDs to documents, or from get_node().
+
+        Returns a dictionary with the number of documents 'changed',
+        'unchanged' and 'failed', and the (node_id, error) tuples of the
+        failures as 'errors'.
+        """
+        def edit_if_changed(json_data):
+            """ Updates a node if its document has changed. """
+            if 'id' not in json_data:
+                raise Exception("No node id in the provided JSON.")
+
+            node_id = json_data['id']
+            existing = None
+
+            if current is not None:
+                existing = current.get(node_id)
+
+            if existing is None:
+                existing = self.get_node(node_id)
+
+            if isinstance(existing, LazyDocument):
+                existing = existing.materialize()
+
+            if _canonical_hash(existing) == _canonical_hash(json_data):
+                return False
+
+            self.edit_node(json_data)
+
+            return True
+
+        summary = {'changed': 0, 'unchanged': 0, 'failed': 0, 'errors': []}
+
+        for (_, json_data, changed, error) in self._imap(
+                edit_if_changed, documents, concurrency, ordered=False):
+            if error is not None:
+                summary['failed'] += 1
+                summary['errors'].append((json_data.get('id'), error))
+            elif changed:
+                summary['changed'] += 1
+            else:
+                summary['unchanged'] += 1
+
+        return summary
+
+    def _decode(self, content, endpoint=None):
+        """
+        Parses JSON content from the server. Unless the client was configured
+        for unicode strings, text is converted to UTF-8 encoded strings as it
+        is parsed. If the (method, url) endpoint the content came from is
+        provided, the decoding time is recorded.
+        """
+        #pylint: disable=undefined-variable
+        if endpoint is not None:
+            return self._timed(self._decode, content, endpoint)
+
+        if self._unicode_strings:
+            return json.loads(content)
+
+        data = json.loads(content, object_pairs_hook=_utf8_object)
+
+        # The hook only sees JSON objects, so anything else at the top level
+        # still needs converting.
+        if isinstance(data, list):
+            data = _utf8_list(data)
+        elif isinstance(data, unicode):
+            data = data.encode('utf-8')
+
+        return data
+
+    def _decode_results(self, content, endpoint=None):
+        """
+        Parses node documents and query results from the server. If the
+        client was configured for lazy results, read-only views are returned
+        that only decode each field when it is first accessed.
+        """
+        if endpoint is not None:
+            return self._timed(self._decode_results, content, endpoint)
+
+        if not self._lazy_results:
+            return self._decode(content)
+
+        first = content.lstrip()[:1]
+
+        if first == '{':
+            return LazyDocument(content, decoder=self._decode)
+
+        if first == '[':
+            return LazyList(content, decoder=self._decode)
+
+        return self._decode(content)
 
     def get_info(self):
         """
@@ -127,9 +557,7 @@ class OSDF(object):
         """
         osdf_response = self._request.get("/info")
 
-        info = json.loads(osdf_response['content'])
-
-        info = self._byteify(info)
+        info = self._decode(osdf_response['content'], ("GET", "/info"))
 
         return info
 
@@ -139,55 +567,205 @@ class OSDF(object):
 
         Returns the parsed form of the JSON document for the node
         """
+        content = None
+
+        if self._mirror is not None:
+            content = self._mirror.get(node_id)
+
+        # The raw document is cached, rather than the parsed form, so that
+        # callers are free to modify the data they are given.
+        if content is None:
+            content = self._node_cache.get(node_id)
+
+        if content is None:
+            content = self._retrieve_node(node_id)
+            self._node_cache.set(node_id, content)
+
+            # Read through to the mirror, which ignores nodes from other
+            # namespaces.
+            if self._mirror is not None:
+                self._mirror.store([content])
+
+        data = self._decode_results(content, ("GET", "/nodes/" + node_id))
+
+        return data
+
+    def _retrieve_node(self, node_id):
+        """
+        Retrieves the raw JSON document of a node from the server.
+        """
         osdf_response = self._request.get("/nodes/" + node_id)
 
         if osdf_response["code"] != 200:
             headers = osdf_response['headers']
-            self._header_error(headers, 'retrieve', 'node')
+            self._header_error(headers, 'retrieve', 'node',
+                               osdf_response['code'])
 
-        data = json.loads(osdf_response['content'])
+        return osdf_response['content']
 
-        data = self._byteify(data)
+    def _mirrored_links(self, documents):
+        """
+        Presents nodes from the mirror in the same form as the server's
+        responses for linked nodes.
+        """
+        content = '{"result_count": %d, "page": 1, "results": [%s]}' % \
+            (len(documents), ",".join(documents))
 
-        return data
+        return self._decode_results(content)
 
-    def get_nodes_in(self, node_id):
+    def _mirror_complete(self):
         """
-        Retrieves the nodes that link to the OSDF node identified by the
-        given the node ID.
+        Whether the attached mirror, if any, holds a complete copy of its
+        namespace, so that queries about links and types can be answered
+        from it.
+        """
+        return self._mirror is not None and \
+            self._mirror.refreshed is not None
 
+    def get_nodes_in(self, node_id, fresh=False):
+        """
+        Retrieves the nodes that link to the OSDF node identified by the
+        given the node ID. If fresh is True, the server is always asked,
+        even if a refreshed mirror holds the node.
         """
+        if not fresh and self._mirror_complete() and node_id in self._mirror:
+            return self._mirrored_links(self._mirror.linked_in(node_id))
+
         url = "/nodes/{}/in".format(node_id)
         osdf_response = self._request.get(url)
 
         if osdf_response["code"] != 200:
             headers = osdf_response['headers']
-            self._header_error(headers, 'retrieve', 'node')
-
-        data = json.loads(osdf_response['content'])
+            self._header_error(headers, 'retrieve', 'node',
+                               osdf_response['code'])
 
-        data = self._byteify(data)
+        data = self._decode_results(osdf_response['content'], ("GET", url))
 
         return data
 
-    def get_nodes_out(self, node_id):
+    def get_nodes_out(self, node_id, fresh=False):
         """
         Retrieves the OSDF nodes that the given node links to (via it's linkage
-        field).
+        field). If fresh is True, the server is always asked, even if a
+        refreshed mirror holds the node and the nodes it links to.
         """
+        # Linked nodes in other namespaces are only known to the server.
+        if not fresh and self._mirror_complete() and \
+                node_id in self._mirror and self._mirror.has_targets(node_id):
+            return self._mirrored_links(self._mirror.linked_out(node_id))
+
         url = "/nodes/{}/out".format(node_id)
         osdf_response = self._request.get(url)
 
         if osdf_response["code"] != 200:
             headers = osdf_response['headers']
-            self._header_error(headers, 'retrieve', 'node')
+            self._header_error(headers, 'retrieve', 'node',
+                               osdf_response['code'])
 
-        data = json.loads(osdf_response['content'])
-
-        data = self._byteify(data)
+        data = self._decode_results(osdf_response['content'], ("GET", url))
 
         return data
 
+    def iter_nodes_of_type(self, namespace, node_type):
+        """
+        Iterates over all the nodes of the given type in a namespace, from the
+        mirror if one is attached for the namespace and has been refreshed,
+        or by querying the server otherwise.
+        """
+        if self._mirror_complete() and self._mirror.namespace == namespace:
+            return (self._decode_results(content)
+                    for content in self._mirror.of_type(node_type))
+
+        query = json.dumps({"query": {"term": {"node_type": node_type}}})
+
+        return self.iter_query(namespace, query)
+
+    def refresh_mirror(self, full=False, max_workers=None):
+        """
+        Brings the attached mirror up to date with the server. The first
+        time, or if full is True, every node of the namespace is copied.
+        Afterwards only the versions of the nodes are listed, and just the
+        nodes that are new or whose version has changed are retrieved. Nodes
+        no longer on the server are removed from the mirror. The query cache
+        is bypassed, so that no stale results are copied.
+
+        Returns a dictionary with the number of nodes stored, removed and
+        unchanged.
+        """
+        mirror = self._mirror
+
+        if mirror is None:
+            raise Exception("No mirror is attached to the client.")
+
+        namespace = mirror.namespace
+        started = time.time()
+        known = mirror.versions()
+        seen = set()
+        stored = 0
+
+        # Nodes read through before the first refresh do not make a copy of
+        # the namespace, so it is still copied in full.
+        if full or mirror.refreshed is None:
+            query = json.dumps({"query": {"match_all": {}}})
+            batch = []
+
+            for document in self.iter_query(namespace, query,
+                                             cached=False):
+                seen.add(document['id'])
+
+                if isinstance(document, LazyDocument):
+                    batch.append(document.raw())
+                else:
+                    batch.append(json.dumps(document))
+
+                if len(batch) >= 1000:
+                    stored += mirror.store(batch)
+                    batch = []
+
+            stored += mirror.store(batch)
+        else:
+            # Only the ID and version of each node are needed to find the
+            # ones that have changed.
+            query = json.dumps({"query": {"match_all": {}},
+                                "_source": ["id", "ver"]})
+            changed = []
+
+            for document in self.iter_query(namespace, query,
+                                             cached=False):
+                node_id = document['id']
+                seen.add(node_id)
+
+                if known.get(node_id) != document.get('ver'):
+                    changed.append(node_id)
+
+            batch = []
+
+            for (_, node_id, content, error) in self._imap(
+                    self._retrieve_node, changed, max_workers, ordered=False):
+                if error is not None:
+                    raise error
+
+                self._node_cache.discard(node_id)
+                batch.append(content)
+
+                if len(batch) >= 1000:
+                    stored += mirror.store(batch)
+                    batch = []
+
+            stored += mirror.store(batch)
+
+        removed = [node_id for node_id in known if node_id not in seen]
+        mirror.remove(removed)
+        mirror.mark_refreshed(started)
+
+        stats = {
+            'stored': stored,
+            'removed': len(removed),
+            'unchanged': len(seen) - stored
+        }
+
+        return stats
+
     def get_node_by_version(self, node_id, version):
         """
         Given a numerical version number, retrieves an OSDF node's data
@@ -195,33 +773,196 @@ class OSDF(object):
 
         Returns the parsed form of the JSON document for the node
         """
-        osdf_response = self._request.get("/nodes/%s/ver/%s" % (node_id, version))
+        key = (node_id, str(version))
+        content = self._version_cache.get(key)
 
-        if osdf_response["code"] != 200:
-            headers = osdf_response['headers']
-            self._header_error(headers, 'retrieve', 'node')
+        if content is None:
+            osdf_response = self._request.get("/nodes/%s/ver/%s" % key)
+
+            if osdf_response["code"] != 200:
+                headers = osdf_response['headers']
+                self._header_error(headers, 'retrieve', 'node',
+                                   osdf_response['code'])
 
-        data = json.loads(osdf_response['content'])
+            content = osdf_response['content']
+            self._version_cache.set(key, content)
 
-        data = self._byteify(data)
+        data = self._decode_results(content, ("GET", "/nodes/%s/ver/%s" % key))
 
         return data
 
+    def get_nodes(self, node_ids, max_workers=None, ordered=True):
+        """
+        Retrieves many OSDF nodes concurrently, given their IDs or (node ID,
+        version) tuples.
+
+        Returns an iterator of (node_id, node, error) tuples, in the order of
+        node_ids unless ordered is False. Failed nodes have an error instead.
+        """
+        def fetch(node_id):
+            """ Retrieves a single node, by version if one was provided. """
+            if isinstance(node_id, tuple):
+                return self.get_node_by_version(*node_id)
+
+            return self.get_node(node_id)
+
+        results = self._imap(fetch, node_ids, max_workers, ordered)
+
+        for (_, node_id, node, error) in results:
+            yield (node_id, node, error)
+
+    def traverse(self, start_ids, direction='out', max_depth=None,
+                 node_types=None, max_workers=None, fresh=False):
+        """
+        Walks the graph of nodes linked to the given starting node (or list
+        of nodes) breadth-first. The direction is 'out' to follow the
+        linkages of each node, 'in' to follow the nodes linking to it, or
+        'both'. The walk stops max_depth links away from the starting nodes,
+        if provided. If node_types is provided, nodes of other types are
+        neither returned nor traversed through. Requests are made
+        concurrently, up to max_workers at a time if provided. If fresh is
+        True, the linked nodes are always retrieved from the server rather
+        than from the mirror.
+
+        Returns a Traversal, which yields (node_id, node, depth) tuples as
+        the nodes are found, and then holds the links between them in its
+        adjacency dictionary.
+        """
+        return Traversal(self, start_ids, direction, max_depth, node_types,
+                         max_workers, fresh)
+
+    def export_namespace(self, namespace, path, query=None, checkpoint=None,
+                         max_workers=None):
+        """
+        Writes the nodes of a namespace, or those matching an ElasticSearch
+        query, to a gzip compressed file of newline delimited JSON, retrieving
+        pages of results concurrently. Progress is recorded in a checkpoint
+        file, path + ".checkpoint" unless another is provided, so that an
+        interrupted export resumes where it stopped when run again.
+
+        Returns a dictionary with the number of 'pages' and 'documents'
+        written.
+        """
+        return archive.export_namespace(self, namespace, path, query,
+                                        checkpoint, max_workers)
+
+    def import_namespace(self, path, checkpoint=None, concurrency=None):
+        """
+        Inserts the nodes of a file written by export_namespace(),
+        concurrently, and in the order of their linkages, which are
+        rewritten to the IDs the nodes are given. The new IDs are recorded in
+        a checkpoint file, path + ".checkpoint" unless another is provided,
+        so that an interrupted import resumes where it stopped when run
+        again.
+
+        Returns a dictionary with the number of nodes 'inserted', 'skipped'
+        (already inserted) and 'failed', the (node_id, error) tuples of the
+        failures as 'errors', and a dictionary of the original node IDs to
+        the new ones as 'ids'.
+        """
+        return archive.import_namespace(self, path, checkpoint, concurrency)
+
+    def _get_schema_data(self, url, key, document_type):
+        """
+        Retrieves a schema document (or collection of schema documents),
+        consulting the schema cache if it is enabled. Returns a tuple of the
+        parsed data and a boolean indicating whether it was newly downloaded.
+        """
+        if self._schema_ttl is None:
+            osdf_response = self._request.get(url)
+
+            if osdf_response["code"] != 200:
+                headers = osdf_response['headers']
+                self._header_error(headers, 'retrieve', document_type,
+                                   osdf_response['code'])
+
+            schema_data = self._decode(osdf_response['content'], ("GET", url))
+
+            return (schema_data, True)
+
+        now = time.time()
+        entry = self._schema_cache.get(key)
+
+        if entry is not None and now - entry['checked'] < self._schema_ttl:
+            return (copy.deepcopy(entry['data']), False)
+
+        # If the server told us how to identify the version we have, ask it
+        # to send the document only if it has changed.
+        request_headers = {}
+
+        if entry is not None:
+            if entry['etag'] is not None:
+                request_headers['If-None-Match'] = entry['etag']
+            if entry['last_modified'] is not None:
+                request_headers['If-Modified-Since'] = entry['last_modified']
+
+        osdf_response = self._request.get(url, request_headers)
+        headers = osdf_response['headers']
+        downloaded = True
+
+        if osdf_response["code"] == 304 and entry is not None:
+            entry = dict(entry, checked=now)
+            downloaded = False
+        elif osdf_response["code"] == 200:
+            entry = {
+                'data': self._decode(osdf_response['content'], ("GET", url)),
+                'etag': headers.get('etag'),
+                'last_modified': headers.get('last-modified'),
+                'checked': now
+            }
+        else:
+            self._header_error(headers, 'retrieve', document_type,
+                               osdf_response['code'])
+
+        self._schema_cache.set(key, entry)
+
+        return (copy.deepcopy(entry['data']), downloaded)
+
+    def _fill_schema_cache(self, kind, namespace, all_schema_data):
+        """
+        Populate the cache entries for the individual schemas contained in
+        the collection of all of a namespace's schemas.
+        """
+        if self._schema_ttl is None or not isinstance(all_schema_data, dict):
+            return
+
+        now = time.time()
+
+        # The entries are copies, as the caller is handed all_schema_data.
+        for (schema_name, schema_data) in all_schema_data.items():
+            entry = {
+                'data': copy.deepcopy(schema_data),
+                'etag': None,
+                'last_modified': None,
+                'checked': now
+            }
+
+            self._schema_cache.set((kind, namespace, schema_name), entry)
+
+    def clear_schema_cache(self, namespace=None):
+        """
+        Discard the cached schemas and auxiliary schemas for the given
+        namespace, or for all namespaces if none is specified.
+        """
+        if namespace is None:
+            self._schema_cache.clear()
+            self._validators = {}
+        else:
+            self._schema_cache.discard_where(lambda key: key[1] == namespace)
+            self._validators.pop(namespace, None)
+
     def get_schemas(self, namespace):
         """
         Retrieves all of the schemas for a particular namespace.
         """
         url = '/namespaces/%s/schemas/' % namespace
 
-        osdf_response = self._request.get(url)
-
-        if osdf_response["code"] != 200:
-            headers = osdf_response['headers']
-            self._header_error(headers, 'retrieve', 'schemas')
-
-        all_schema_data = json.loads(osdf_response['content'])
+        (schema_data, downloaded) = self._get_schema_data(
+            url, ('schemas', namespace), 'schemas'
+        )
 
-        schema_data = self._byteify(all_schema_data)
+        if downloaded:
+            self._fill_schema_cache('schema', namespace, schema_data)
 
         return schema_data
 
@@ -233,15 +974,9 @@ class OSDF(object):
         """
         url = '/namespaces/%s/schemas/%s' % (namespace, schema_name)
 
-        osdf_response = self._request.get(url)
-
-        if osdf_response["code"] != 200:
-            headers = osdf_response['headers']
-            self._header_error(headers, 'retrieve', 'schema')
-
-        schema_data = json.loads(osdf_response['content'])
-
-        schema_data = self._byteify(schema_data)
+        (schema_data, _) = self._get_schema_data(
+            url, ('schema', namespace, schema_name), 'schema'
+        )
 
         return schema_data
 
@@ -253,15 +988,12 @@ class OSDF(object):
         """
         url = '/namespaces/%s/schemas/aux/' % (namespace)
 
-        osdf_response = self._request.get(url)
+        (aux_schema_data, downloaded) = self._get_schema_data(
+            url, ('aux_schemas', namespace), 'aux schemas'
+        )
 
-        if osdf_response["code"] != 200:
-            headers = osdf_response['headers']
-            self._header_error(headers, 'retrieve', 'aux schemas')
-
-        aux_schema_data = json.loads(osdf_response['content'])
-
-        aux_schema_data = self._byteify(aux_schema_data)
+        if downloaded:
+            self._fill_schema_cache('aux_schema', namespace, aux_schema_data)
 
         return aux_schema_data
 
@@ -273,15 +1005,9 @@ class OSDF(object):
         """
         url = '/namespaces/%s/schemas/aux/%s' % (namespace, aux_schema_name)
 
-        osdf_response = self._request.get(url)
-
-        if osdf_response["code"] != 200:
-            headers = osdf_response['headers']
-            self._header_error(headers, 'retrieve', 'aux schema')
-
-        aux_schema_data = json.loads(osdf_response['content'])
-
-        aux_schema_data = self._byteify(aux_schema_data)
+        (aux_schema_data, _) = self._get_schema_data(
+            url, ('aux_schema', namespace, aux_schema_name), 'aux schema'
+        )
 
         return aux_schema_data
 
@@ -296,6 +1022,8 @@ class OSDF(object):
         osdf_response = self._request.post("/nodes", json_str)
         node_id = None
 
+        self._invalidate_queries(json_data.get('ns'))
+
         headers = osdf_response["headers"]
 
         if osdf_response["code"] == 201:
@@ -309,29 +1037,185 @@ class OSDF(object):
             else:
                 msg = "Unable to insert node document."
 
-            raise Exception(msg)
+            raise HTTPStatusException(osdf_response["code"], msg)
+
+        # Only nodes of the mirror's namespace need to be read back.
+        if self._mirror is not None and \
+                json_data.get('ns') == self._mirror.namespace:
+            self._mirror_written(node_id)
 
         return node_id
 
+    def insert_nodes(self, documents, concurrency=None, ordered=True,
+                     start=0):
+        """
+        Inserts many nodes into OSDF concurrently, starting from the document
+        at index start, so that an interrupted load can be resumed.
+
+        Returns an iterator of (index, node_id, error) tuples, in input order
+        unless ordered is False. Failed documents have an error instead.
+        """
+        documents = itertools.islice(documents, start, None)
+        results = self._imap(self.insert_node, documents, concurrency,
+                             ordered, idempotent=False)
+
+        for (index, _, node_id, error) in results:
+            yield (start + index, node_id, error)
+
     def delete_node(self, node_id):
         """
         Deletes the specified node from OSDF.
         """
         osdf_response = self._request.delete("/nodes/" + node_id)
 
+        # Deleting a node also removes its history
+        self._node_cache.discard(node_id)
+        self._version_cache.discard_where(lambda key: key[0] == node_id)
+
+        # The node's namespace is not known, so the results of queries of
+        # every namespace are discarded.
+        self._invalidate_queries()
+
+        if self._mirror is not None:
+            self._mirror.remove([node_id])
+
         if osdf_response['code'] != 204:
             headers = osdf_response['headers']
-            self._header_error(headers, 'delete', 'node')
+            self._header_error(headers, 'delete', 'node',
+                               osdf_response['code'])
+
+    def delete_nodes(self, node_ids, concurrency=None, ordered=True):
+        """
+        Deletes many nodes from OSDF concurrently.
+
+        Returns an iterator of (node_id, error) tuples, in the order of
+        node_ids unless ordered is False.
+        """
+        results = self._imap(self.delete_node, node_ids, concurrency, ordered)
+
+        for (_, node_id, _, error) in results:
+            yield (node_id, error)
+
+    def plan_subtree_deletion(self, root_id):
+        """
+        Works out the order in which a node, and all the nodes that depend on
+        it (that link to it, directly or indirectly), can be deleted. A node
+        can only be deleted once nothing links to it any more.
 
-    def validate_node(self, json_data):
+        Returns a list of lists of node IDs. The nodes in each list can be
+        deleted in parallel once those in the preceding lists are gone; the
+        root is always in the last list.
+        """
+        # A stale mirror could miss nodes that would be left dangling, so
+        # the nodes linking to each one always come from the server.
+        traversal = self.traverse(root_id, direction='in', fresh=True)
+        adjacency = traversal.run()
+
+        if traversal.errors:
+            (node_id, error) = list(traversal.errors.items())[0]
+            msg = "Unable to find the nodes depending on %s. Reason: %s" \
+                % (node_id, error)
+            raise Exception(msg)
+
+        # For each node of the subtree, the nodes still linking to it
+        dependents = dict((node_id, set()) for node_id in adjacency)
+
+        for (source_id, target_ids) in adjacency.items():
+            for target_id in target_ids:
+                dependents[target_id].add(source_id)
+
+        # Peel off the nodes nothing links to, level by level.
+        plan = []
+
+        while dependents:
+            level = sorted([node_id for (node_id, sources)
+                            in dependents.items() if not sources])
+
+            if not level:
+                raise Exception("Unable to plan deletion of %s: its " \
+                                "dependents link to each other in a cycle." \
+                                % root_id)
+
+            plan.append(level)
+
+            for node_id in level:
+                del dependents[node_id]
+
+            for sources in dependents.values():
+                sources.difference_update(level)
+
+        return plan
+
+    def delete_subtree(self, root_id, dry_run=False, concurrency=None):
+        """
+        Deletes a node along with every node that depends on it (that links
+        to it, directly or indirectly), discovering them through the nodes
+        linking to each one. The nodes nothing links to are deleted first,
+        and each level of the hierarchy is deleted in parallel. If dry_run is
+        True, nothing is deleted.
+
+        Returns the plan that was, or would be, followed, as described for
+        plan_subtree_deletion().
+        """
+        plan = self.plan_subtree_deletion(root_id)
+
+        if dry_run:
+            return plan
+
+        for level in plan:
+            failures = [(node_id, error) for (node_id, error)
+                        in self.delete_nodes(level, concurrency, ordered=False)
+                        if error is not None]
+
+            # Nodes further up can't be deleted while these still link to
+            # them.
+            if failures:
+                (node_id, error) = failures[0]
+                msg = "Unable to delete %d nodes of the subtree of %s, " \
+                    "including %s. Reason: %s" \
+                    % (len(failures), root_id, node_id, error)
+                raise Exception(msg)
+
+        return plan
+
+    def get_validator(self, namespace):
+        """
+        Retrieves a NodeValidator for validating node documents locally
+        against the schemas of the given namespace. The namespace's schemas
+        are only retrieved and compiled once. Raises an ImportError, without
+        retrieving anything, if the jsonschema package is not installed.
+        """
+        validator = self._validators.get(namespace)
+
+        if validator is None:
+            # Loaded on first use, as jsonschema is slow to import
+            from validator import NodeValidator
+
+            validator = NodeValidator.from_osdf(self, namespace)
+            self._validators[namespace] = validator
+
+        return validator
+
+    def validate_node(self, json_data, local=False):
         """
         Report whether a node document validates against OSDF and its notion
         of what that node should look like according to any registered schemas.
+        If local is True, the document is validated in-process against the
+        namespace's schemas instead, falling back to the server if that is not
+        possible (for instance, if the jsonschema package is not installed).
 
         Returns a tuple with the first value holding a boolean of whether the
         document validated or not. The second value contains the error message
         if the document did not validate.
         """
+        if local and isinstance(json_data, dict) and 'ns' in json_data:
+            try:
+                validator = self.get_validator(json_data['ns'])
+            except ImportError:
+                pass
+            else:
+                return validator.validate(json_data)
+
         json_str = json.dumps(json_data)
         url = "/nodes/validate"
 
@@ -351,13 +1235,51 @@ class OSDF(object):
 
         return (valid, error_msg)
 
-    def oql_query(self, namespace, query, page=1):
+    def validate_nodes(self, namespace, documents, processes=None):
         """
-        Issue an OSDF Query Language (OQL) query against OSDF.
+        Validate many node documents from a namespace locally, as in
+        validate_node(), optionally spreading the work across several
+        processes. If local validation is not possible, the documents are
+        validated by the server, several at a time.
 
-        Returns the specified page of results.
+        Returns an iterator of (valid, error_msg) tuples in the same order as
+        documents.
+        """
+        def validate_remotely():
+            """ Validates the documents using the server. """
+            results = self._imap(self.validate_node, documents)
+
+            for (_, _, result, error) in results:
+                if error is not None:
+                    raise error
+
+                yield result
+
+        try:
+            validator = self.get_validator(namespace)
+        except ImportError:
+            return validate_remotely()
+
+        return validator.validate_many(documents, processes)
+
+    def _query_content(self, language, namespace, query, page, cached=True):
+        """
+        Retrieves the raw content of a page of results of an ElasticSearch
+        ('query') or OQL ('oql') query, from the query cache if possible.
+        If cached is False, the query cache is neither read nor filled.
+        Returns the URL of the page along with the content.
         """
-        url = "/nodes/oql/%s/page/%s" % (namespace, str(page))
+        url = "/nodes/%s/%s/page/%s" % (language, namespace, str(page))
+        key = (self._server, self._port, self._username, language, namespace,
+               query, str(page))
+
+        query_cache = self._query_cache if cached else None
+
+        if query_cache is not None:
+            content = query_cache.get(key)
+
+            if content is not None:
+                return (url, content)
 
         osdf_response = self._request.post(url, query)
 
@@ -365,100 +1287,225 @@ class OSDF(object):
             headers = osdf_response["headers"]
 
             if 'x-osdf-error' in headers:
-                msg = "Unable to query namespace %s. Reason: %s" \
-                     % (namespace, headers['x-osdf-error'])
+                msg = "Unable to query namespace %s. Reason: %s" % \
+                    (namespace, headers['x-osdf-error'])
             else:
                 msg = "Unable to query namespace."
 
-            raise Exception(msg)
+            raise HTTPStatusException(osdf_response["code"], msg)
 
-        data = json.loads(osdf_response['content'])
+        content = osdf_response['content']
 
-        data = self._byteify(data)
+        if query_cache is not None:
+            query_cache.set(key, content,
+                            tag=(self._server, self._port, namespace))
 
-        return data
+        return (url, content)
 
-    def query(self, namespace, query, page=1):
+    def oql_query(self, namespace, query, page=1, fields=None, cached=True):
         """
-        Issue a query against OSDF. Queries are expressed in JSON form using
-        the ElasticSearch Query DSL.
+        Issue an OSDF Query Language (OQL) query against OSDF. If a list of
+        fields (which may be dotted paths, such as "meta.subtype") is
+        provided, the result documents are trimmed to only those fields. OQL
+        cannot limit the fields the server returns, so this only saves
+        memory, not transfer. If cached is False, the query cache is
+        bypassed.
 
         Returns the specified page of results.
         """
-        url = "/nodes/query/%s/page/%s" % (namespace, str(page))
+        (url, content) = self._query_content('oql', namespace, query, page,
+                                             cached)
 
-        osdf_response = self._request.post(url, query)
+        data = self._decode_results(content, ("POST", url))
 
-        if osdf_response["code"] != 200 and osdf_response["code"] != 206:
-            headers = osdf_response["headers"]
+        if fields is not None:
+            # Lazy results are read-only, so copy them into a new dict.
+            data = dict(data)
+            data['results'] = [_project(document, fields)
+                               for document in data['results']]
 
-            if 'x-osdf-error' in headers:
-                msg = "Unable to query namespace %s. Reason: %s" % \
-                    (namespace, headers['x-osdf-error'])
-            else:
-                msg = "Unable to query namespace."
+        return data
 
-            raise Exception(msg)
+    def query(self, namespace, query, page=1, fields=None, cached=True):
+        """
+        Issue a query against OSDF. Queries are expressed in JSON form using
+        the ElasticSearch Query DSL. If a list of fields (which may be dotted
+        paths, such as "meta.subtype") is provided, ElasticSearch source
+        filtering is added to the query, so that the server only returns
+        those fields of the result documents. If cached is False, the query
+        cache is bypassed.
+
+        Returns the specified page of results.
+        """
+        if fields is not None:
+            query = _source_filtered(query, fields)
 
-        data = json.loads(osdf_response['content'])
+        (url, content) = self._query_content('query', namespace, query, page,
+                                             cached)
 
-        data = self._byteify(data)
+        data = self._decode_results(content, ("POST", url))
 
         return data
 
-    def oql_query_all_pages(self, namespace, query):
+    def _pages(self, page_getter, namespace, query, prefetch=4):
         """
-        Issue an OSDF Query Language (OQL) query against OSDF, as in the
-        oql_query() method, but retrieves ALL results by aggregating all
-        the available pages of results. Use with caution, as this may
-        consume a lot of memory with large result sets.
+        Generator that retrieves successive pages of query results with
+        the provided page_getter (query() or oql_query()). Once the first
+        page reveals the page size and total number of hits, up to prefetch
+        of the remaining pages are requested concurrently. Pages are always
+        yielded in order.
         """
-        more_results = True
         page = 1
-        cumulative_results = []
+        results = page_getter(namespace, query, page)
 
-        while more_results:
-            results = self.oql_query(namespace, query, page)
+        total = results.get('search_result_total')
+        page_size = results['result_count']
+        retrieved = page_size
+        more_results = page_size > 0
 
-            cumulative_results.extend(results['results'])
+        yield results
 
-            if results['result_count'] > 0:
-                page += 1
-            else:
-                more_results = False
+        def fetch(page_number):
+            """ Retrieves a single page of results. """
+            return page_getter(namespace, query, page_number)
 
-        results['results'] = cumulative_results
-        results['result_count'] = len(results['results'])
-        del results['page']
+        if more_results and total is not None and prefetch > 1:
+            last_page = -(-total // page_size)
+            pages = range(page + 1, last_page + 1)
 
-        return results
+            # Only prefetch pages are held at a time, even when a slow page
+            # holds up the ones after it.
+            for (_, page, results, error) in self._imap(fetch, pages,
+                                                        prefetch,
+                                                        window=prefetch):
+                if error is not None:
+                    raise error
+
+                retrieved += results['result_count']
+                more_results = results['result_count'] > 0
 
-    def query_all_pages(self, namespace, query):
+                yield results
+
+                if not more_results:
+                    break
+
+        # Without a known total (or prefetching), request one page at a time.
+        # If the total is known there is no need to request the final, empty,
+        # page to discover that the results are exhausted.
+        while more_results and (total is None or retrieved < total):
+            page += 1
+            results = page_getter(namespace, query, page)
+
+            retrieved += results['result_count']
+            more_results = results['result_count'] > 0
+
+            yield results
+
+    def _iter_results(self, page_getter, namespace, query, prefetch=4):
         """
-        Issue a query against OSDF, as in the query() method, but retrieves
-        ALL results by aggregating all the available pages of results. Use with
-        caution, as this may consume a lot of memory with large result sets.
+        Generator that yields the individual result documents from each page
+        of results. Documents are released as they are yielded, so only the
+        pages in the prefetch window are held in memory at a time.
         """
-        more_results = True
-        page = 1
-        cumulative_results = []
+        for results in self._pages(page_getter, namespace, query, prefetch):
+            documents = results['results']
 
-        while more_results:
-            results = self.query(namespace, query, page)
+            # Lazy results are read-only, and only hold the page's raw text.
+            if isinstance(documents, LazyList):
+                for document in documents:
+                    yield document
+                continue
 
-            cumulative_results.extend(results['results'])
+            documents.reverse()
 
-            if results['result_count'] > 0:
-                page += 1
-            else:
-                more_results = False
+            while documents:
+                yield documents.pop()
 
+    def _all_pages(self, page_getter, namespace, query, prefetch=4):
+        """
+        Aggregates all the pages of results into a single result set.
+        """
+        cumulative_results = []
+
+        for results in self._pages(page_getter, namespace, query, prefetch):
+            cumulative_results.extend(results['results'])
+
+        # Lazy results are read-only, so copy them into a new dict.
+        results = dict(results)
         results['results'] = cumulative_results
         results['result_count'] = len(results['results'])
         del results['page']
 
         return results
 
+    def _oql_page_getter(self, fields):
+        """
+        Retrieves a function that retrieves pages of OQL results, trimmed to
+        the given fields if any.
+        """
+        if fields is None:
+            return self.oql_query
+
+        def oql_page(namespace, query, page):
+            """ Retrieves a page of OQL results with only some fields. """
+            return self.oql_query(namespace, query, page, fields)
+
+        return oql_page
+
+    def iter_oql_query(self, namespace, query, prefetch=4, fields=None):
+        """
+        Issue an OSDF Query Language (OQL) query against OSDF, and iterate
+        over ALL the results one document at a time. Pages of results are
+        retrieved as they are needed, with up to prefetch pages requested
+        ahead of time, so memory use is bounded by the prefetch window. If a
+        list of fields is provided, documents only hold those fields, as in
+        oql_query().
+        """
+        return self._iter_results(self._oql_page_getter(fields), namespace,
+                                  query, prefetch)
+
+    def iter_query(self, namespace, query, prefetch=4, fields=None,
+                   cached=True):
+        """
+        Issue a query against OSDF, and iterate over ALL the results one
+        document at a time. Pages of results are retrieved as they are needed,
+        with up to prefetch pages requested ahead of time, so memory use is
+        bounded by the prefetch window. If a list of fields is provided, only
+        those fields of the documents are retrieved, as in query(). If cached
+        is False, the query cache is bypassed.
+        """
+        if fields is not None:
+            query = _source_filtered(query, fields)
+
+        def page_getter(namespace, query, page):
+            """ Retrieves a page of results, from the cache if allowed. """
+            return self.query(namespace, query, page, cached=cached)
+
+        return self._iter_results(page_getter, namespace, query, prefetch)
+
+    def oql_query_all_pages(self, namespace, query, prefetch=4, fields=None):
+        """
+        Issue an OSDF Query Language (OQL) query against OSDF, as in the
+        oql_query() method, but retrieves ALL results by aggregating all
+        the available pages of results. Use with caution, as this may
+        consume a lot of memory with large result sets. For large result
+        sets, consider iter_oql_query() instead.
+        """
+        return self._all_pages(self._oql_page_getter(fields), namespace,
+                               query, prefetch)
+
+    def query_all_pages(self, namespace, query, prefetch=4, fields=None):
+        """
+        Issue a query against OSDF, as in the query() method, but retrieves
+        ALL results by aggregating all the available pages of results. Use with
+        caution, as this may consume a lot of memory with large result sets.
+        For large result sets, consider iter_query() instead.
+        """
+        if fields is not None:
+            query = _source_filtered(query, fields)
+
+        return self._all_pages(self.query, namespace, query, prefetch)
+
     def create_osdf_node(self, namespace, node_type, domain_json, linkage=None,
                          read="all", write="all"):
         """
@@ -478,9 +1525,11 @@ class OSDF(object):
         return node_json
 
     def _header_error(self, headers=None, method_type='retrieve',
-                      document_type=None):
+                      document_type=None, status=None):
         """
         Raise an exception, potentially using information from HTTP headers.
+        If the HTTP status of the response is provided, an HTTPStatusException
+        carrying it is raised.
         """
         if not headers:
             headers = []
@@ -492,4 +1541,7 @@ class OSDF(object):
             msg = "Unable to %s %s document." \
                 % (method_type, document_type)
 
+        if status is not None:
+            raise HTTPStatusException(status, msg)
+
         raise Exception(msg)
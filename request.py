@@ -2,6 +2,15 @@
 
 import httplib
 import base64
+import select
+import socket
+import threading
+import time
+import zlib
+from metrics import endpoint_template
+
+# Methods that may safely be sent again if the server's response was lost
+IDEMPOTENT_METHODS = frozenset(['GET', 'HEAD', 'PUT', 'DELETE'])
 
 class HTTPStatusException(Exception):
 
@@ -12,125 +21,347 @@ class HTTPStatusException(Exception):
     def __str__(self):
         return "Error [%s]: %s" % (self.status, self.message)
 
+class ConnectionPool(object):
+    """
+    A bounded, thread-safe pool of persistent HTTP/1.1 connections to a single
+    (server, port, ssl) endpoint. Idle connections are reused so that callers
+    do not pay for a new TCP (and possibly TLS) handshake on every request.
+    """
+
+    def __init__(self, server, port=8123, ssl=False, maxsize=10,
+                 idle_timeout=30, timeout=None):
+        self.server = server
+        self.port = port
+        self.ssl = ssl
+        self.maxsize = maxsize
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+
+        # Idle connections along with the time they were last returned.
+        self._idle = []
+        self._in_use = 0
+        self._closed = False
+        self._cond = threading.Condition(threading.Lock())
+
+    @property
+    def key(self):
+        """
+        The (server, port, ssl) tuple this pool connects to.
+        """
+        return (self.server, self.port, self.ssl)
+
+    def _new_connection(self):
+        if self.ssl:
+            conn = httplib.HTTPSConnection(self.server, self.port,
+                                           timeout=self.timeout)
+        else:
+            conn = httplib.HTTPConnection(self.server, self.port,
+                                          timeout=self.timeout)
+
+        return conn
+
+    def _is_stale(self, conn, last_used):
+        if time.time() - last_used > self.idle_timeout:
+            return True
+
+        if conn.sock is None:
+            return True
+
+        # An idle keep-alive socket should have nothing to read. If it is
+        # readable, the server has either closed it or sent something we
+        # were not expecting. Either way it can't be reused.
+        try:
+            readable = select.select([conn.sock], [], [], 0)[0]
+        except (select.error, socket.error, ValueError):
+            return True
+
+        return bool(readable)
+
+    def get(self, fresh=False):
+        """
+        Check a connection out of the pool, blocking if the maximum number of
+        connections are already in use. Returns a tuple of the connection and
+        a boolean indicating whether it was reused from the idle list. If
+        fresh is True, a new connection is always opened.
+        """
+        stale = []
+
+        with self._cond:
+            if self._closed:
+                raise Exception("Connection pool is closed.")
+
+            while not self._idle and self._in_use >= self.maxsize:
+                self._cond.wait()
+
+                if self._closed:
+                    raise Exception("Connection pool is closed.")
+
+            conn = None
+            while self._idle and not fresh:
+                (candidate, last_used) = self._idle.pop()
+                if self._is_stale(candidate, last_used):
+                    stale.append(candidate)
+                else:
+                    conn = candidate
+                    break
+
+            self._in_use += 1
+
+        for old in stale:
+            old.close()
+
+        if conn is None:
+            return (self._new_connection(), False)
+
+        return (conn, True)
+
+    def put(self, conn, reusable=True):
+        """
+        Return a connection to the pool. Connections that can't be reused,
+        or that are returned to a closed pool, are closed instead.
+        """
+        with self._cond:
+            self._in_use -= 1
+
+            if reusable and not self._closed and conn.sock is not None:
+                self._idle.append((conn, time.time()))
+                conn = None
+
+            self._cond.notify()
+
+        if conn is not None:
+            conn.close()
+
+    def close(self):
+        """
+        Close all the idle connections and refuse any further checkouts.
+        Connections that are currently checked out are closed as they are
+        returned.
+        """
+        with self._cond:
+            self._closed = True
+            idle = self._idle
+            self._idle = []
+            self._cond.notify_all()
+
+        for (conn, _) in idle:
+            conn.close()
+
+def _gzip(data):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    return compressor.compress(data) + compressor.flush()
+
+def _inflate(data):
+    # Servers disagree on whether "deflate" means a zlib stream or a raw
+    # deflate stream, so accept either.
+    try:
+        return zlib.decompress(data)
+    except zlib.error:
+        return zlib.decompress(data, -zlib.MAX_WBITS)
+
 class HttpRequest(object):
 
-    def __init__(self, server, username, password, port=8123, ssl=False):
+    def __init__(self, server, username, password, port=8123, ssl=False,
+                 pool=None, compress_threshold=None, metrics=None):
         self.server = server
         self.port = port
         self.username = username
         self.password = password
         self.ssl = ssl
+        self.pool = pool
+
+        # Request bodies larger than this many bytes are gzip compressed.
+        # None disables compression of request bodies.
+        self.compress_threshold = compress_threshold
+
+        # An optional metrics.Metrics that every request is recorded in
+        self.metrics = metrics
+
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            'bytes_sent': 0,
+            'bytes_sent_uncompressed': 0,
+            'bytes_received': 0,
+            'bytes_received_uncompressed': 0
+        }
+
+    @property
+    def stats(self):
+        """
+        Retrieve the number of bytes of request and response bodies sent and
+        received, both as transferred and before compression.
+        """
+        with self._stats_lock:
+            return dict(self._stats)
+
+    def _count(self, sent, sent_uncompressed, received, received_uncompressed):
+        with self._stats_lock:
+            self._stats['bytes_sent'] += sent
+            self._stats['bytes_sent_uncompressed'] += sent_uncompressed
+            self._stats['bytes_received'] += received
+            self._stats['bytes_received_uncompressed'] += received_uncompressed
+
+    def _get_connection(self, fresh=False):
+        if self.pool is not None:
+            return self.pool.get(fresh)
 
-    def _get_connection(self):
         if (self.ssl):
            conn = httplib.HTTPSConnection(self.server, self.port)
         else:
            conn = httplib.HTTPConnection(self.server, self.port)
 
-        return conn
+        return (conn, False)
 
-    def delete(self, resource):
-        conn = self._get_connection()
+    def _release_connection(self, conn, reusable):
+        if self.pool is not None:
+            self.pool.put(conn, reusable)
+        else:
+            conn.close()
 
-        conn.putrequest("DELETE", resource)
+    def _send_request(self, conn, method, resource, data, headers):
+        conn.putrequest(method, resource, skip_accept_encoding=True)
         self._set_auth_header(conn)
-        conn.endheaders()
-        resp = conn.getresponse()
-        content = resp.read()
 
-        headers = {}
-        raw_headers = resp.getheaders()
+        for (header_name, header_value) in headers.items():
+            conn.putheader(header_name, header_value)
 
-        for header in raw_headers:
-            header_name = header[0]
-            header_value = header[1]
-            headers[header_name] = header_value
-
-        results = { "headers": headers,
-                    "content": content,
-                    "code": resp.status
-                  }
+        if data is not None:
+            conn.putheader("Content-Length", "%d" % len(data))
 
-        return results
+        # Sending the body along with the headers keeps small requests in a
+        # single packet, rather than stalling on a delayed acknowledgement.
+        conn.endheaders(data)
 
-    def get(self, resource):
-        conn = self._get_connection()
-        conn.putrequest("GET", resource)
-        self._set_auth_header(conn)
-        conn.endheaders()
+    def _read_response(self, conn):
         resp = conn.getresponse()
         content = resp.read()
 
-        raw_headers = resp.getheaders()
+        return (resp, content)
+
+    def _exchange(self, method, resource, data, headers):
+        (conn, reused) = self._get_connection()
+        sent = False
+
+        try:
+            self._send_request(conn, method, resource, data, headers)
+            sent = True
+            (resp, content) = self._read_response(conn)
+        except (httplib.BadStatusLine, httplib.CannotSendRequest, socket.error):
+            self._release_connection(conn, False)
+
+            # A kept-alive connection may have been closed by the server
+            # between our staleness check and the request. Try once more
+            # on a fresh connection before giving up, unless the request
+            # was sent and is not idempotent, as the server may have acted
+            # on it (inserting a node twice, for instance).
+            if not reused or (sent and method not in IDEMPOTENT_METHODS):
+                raise
+
+            (conn, reused) = self._get_connection(fresh=True)
+
+            try:
+                self._send_request(conn, method, resource, data, headers)
+                (resp, content) = self._read_response(conn)
+            except Exception:
+                self._release_connection(conn, False)
+                raise
+        except Exception:
+            self._release_connection(conn, False)
+            raise
+
+        self._release_connection(conn, not resp.will_close)
 
-        for header in raw_headers:
+        resp_headers = {}
+
+        for header in resp.getheaders():
             header_name = header[0]
             header_value = header[1]
-            headers = {}
-            headers[header_name] = header_value
+            resp_headers[header_name] = header_value
 
-        results = { "headers": headers,
+        results = { "headers": resp_headers,
                     "content": content,
                     "code": resp.status
                   }
 
         return results
 
-    def put(self, resource, data):
-        conn = self._get_connection()
-        conn.putrequest("PUT", resource)
-        self._set_auth_header(conn)
-        conn.putheader("Content-Length", "%d" % len(data))
-        conn.endheaders()
+    def _request(self, method, resource, data=None, headers=None):
+        request_headers = {"Accept-Encoding": "gzip, deflate"}
 
-        conn.send(data)
+        if headers is not None:
+            request_headers.update(headers)
 
-        resp = conn.getresponse()
-        raw_headers = resp.getheaders()
-        content = resp.read()
+        body = data
+        compressed = False
 
-        resp_headers = {}
+        if data is not None and self.compress_threshold is not None and \
+                len(data) > self.compress_threshold:
+            body = _gzip(data)
+            compressed = True
+            request_headers["Content-Encoding"] = "gzip"
 
-        for header in raw_headers:
-            header_name = header[0]
-            header_value = header[1]
-            resp_headers[header_name] = header_value
+        started = time.time()
 
-        results = { "headers": resp_headers,
-                    "content": content,
-                    "code": resp.status
-                  }
+        try:
+            results = self._exchange(method, resource, body, request_headers)
 
-        return results
+            # The server doesn't accept compressed bodies, so stop sending
+            # them and try again.
+            if compressed and results["code"] == 415:
+                self.compress_threshold = None
+                del request_headers["Content-Encoding"]
+                body = data
 
-    def post(self, resource, data):
-        conn = self._get_connection()
+                results = self._exchange(method, resource, body,
+                                         request_headers)
+        except Exception:
+            if self.metrics is not None:
+                self.metrics.record_request(method,
+                                            endpoint_template(resource), None,
+                                            time.time() - started, 0, 0)
+            raise
 
-        conn.putrequest("POST", resource)
-        self._set_auth_header(conn)
-        conn.putheader("Content-Length", "%d" % len(data))
-        conn.endheaders()
+        received = len(results["content"])
 
-        conn.send(data)
+        if self.metrics is not None:
+            if body is None:
+                sent = 0
+            else:
+                sent = len(body)
 
-        resp = conn.getresponse()
-        raw_headers = resp.getheaders()
-        content = resp.read()
+            self.metrics.record_request(method, endpoint_template(resource),
+                                        results["code"], time.time() - started,
+                                        sent, received)
 
-        resp_headers = {}
+        encoding = results["headers"].get("content-encoding", "").lower()
 
-        for header in raw_headers:
-            header_name = header[0]
-            header_value = header[1]
-            resp_headers[header_name] = header_value
+        if encoding in ("gzip", "x-gzip"):
+            results["content"] = zlib.decompress(results["content"],
+                                                 16 + zlib.MAX_WBITS)
+        elif encoding == "deflate":
+            results["content"] = _inflate(results["content"])
 
-        results = { "headers": resp_headers,
-                    "content": content,
-                    "code": resp.status
-                  }
+        if data is None:
+            self._count(0, 0, received, len(results["content"]))
+        else:
+            self._count(len(body), len(data), received,
+                        len(results["content"]))
 
         return results
 
+    def delete(self, resource):
+        return self._request("DELETE", resource)
+
+    def get(self, resource, headers=None):
+        return self._request("GET", resource, headers=headers)
+
+    def put(self, resource, data):
+        return self._request("PUT", resource, data)
+
+    def post(self, resource, data):
+        return self._request("POST", resource, data)
+
     def _set_auth_header(self, connection):
         # We don't use the base64.encodestring() method here becuase it automatically adds
         # newlines
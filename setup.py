@@ -1,6 +1,7 @@
 """ Setup script for installation. """
 
 import os
+import sys
 from setuptools import setup
 
 # Utility function to read files. Used for the long_description.
@@ -16,6 +17,13 @@ def get_version():
     version = first_line.split()[1]
     return version
 
+# The asyncio client relies on syntax only available in Python 3.6+.
+MODULES = ['archive', 'cache', 'lazy', 'metrics', 'mirror', 'osdf',
+           'request', 'traversal', 'validator', 'workers']
+
+if sys.version_info >= (3, 6):
+    MODULES.append('async_osdf')
+
 setup(
     name='osdf-python',
     description='Python client to Open Science Data Framework (OSDF) REST servers.',
@@ -27,12 +35,15 @@ setup(
                      'because almost every language has support for ' + \
                      'communications via HTTP and working with JSON.',
     version=get_version(),
-    py_modules=['osdf', 'request'],
+    py_modules=MODULES,
     author='Victor F',
     author_email='victor73@github.com',
     url='http://osdf.igs.umaryland.edu',
     license='MIT',
     install_requires=['jsondiff'],
+    extras_require={
+        'validation': ['jsonschema']
+    },
     scripts=[
         'bin/osdf'
     ],
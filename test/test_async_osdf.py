@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+
+import json
+import os
+import sys
+import unittest
+
+@unittest.skipIf(sys.version_info < (3, 6), "asyncio client requires 3.6+")
+class AsyncOsdfTest(unittest.TestCase):
+    if "OSDF_SERVER" in os.environ:
+        server = os.environ.get("OSDF_SERVER")
+    else:
+        raise Exception("Must define OSDF_SERVER environment variable.")
+
+    if "OSDF_USER" in os.environ:
+        username = os.environ.get("OSDF_USER")
+    else:
+        raise Exception("Must define OSDF_USER environment variable.")
+
+    if "OSDF_PASSWD" in os.environ:
+        password = os.environ.get("OSDF_PASSWD")
+    else:
+        raise Exception("Must define OSDF_PASSWD environment variable.")
+
+    test_node = {
+                  "ns": "test",
+                  "acl": { "read": [ "all" ], "write": [ "all" ] },
+                  "linkage": {},
+                  "node_type": "example",
+                  "meta": {
+                      "description": "something",
+                      "color": "blue"
+                  }
+              }
+
+    def _get_async_osdf(self, limit):
+        from async_osdf import AsyncOSDF
+
+        return AsyncOSDF(AsyncOsdfTest.server, AsyncOsdfTest.username,
+                         AsyncOsdfTest.password, limit=limit)
+
+    def _collect(self, loop, iterator):
+        """
+        Runs an async iterator to exhaustion on the given loop, without
+        needing the async syntax this module must compile without.
+        """
+        #pylint: disable=undefined-variable
+        items = []
+
+        while True:
+            try:
+                items.append(loop.run_until_complete(iterator.__anext__()))
+            except StopAsyncIteration:
+                return items
+
+    def _new_loop(self):
+        import asyncio
+
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+
+        return loop
+
+    def testGetNodesLimited(self):
+        # The client is created before the loop it is used from.
+        osdf = self._get_async_osdf(limit=2)
+        loop = self._new_loop()
+
+        node_ids = [loop.run_until_complete(
+                        osdf.insert_node(AsyncOsdfTest.test_node))
+                    for _ in range(5)]
+
+        try:
+            results = self._collect(loop, osdf.get_nodes(node_ids))
+
+            self.assertEqual([node_id for (node_id, _, _) in results],
+                             node_ids, "Results are in input order.")
+
+            for (node_id, node, error) in results:
+                self.assertIsNone(error, "Node retrieved within the limit.")
+                self.assertEqual(node['id'], node_id,
+                                 "Retrieved node has the right ID.")
+        finally:
+            for node_id in node_ids:
+                loop.run_until_complete(osdf.delete_node(node_id))
+
+            osdf.close()
+
+    def testIterQueryLimited(self):
+        osdf = self._get_async_osdf(limit=1)
+        loop = self._new_loop()
+
+        query = json.dumps({"query": {"match_all": {}}})
+
+        first_page = loop.run_until_complete(osdf.query("test", query))
+        documents = self._collect(loop, osdf.iter_query("test", query,
+                                                         prefetch=4))
+        osdf.close()
+
+        node_ids = set([node['id'] for node in documents])
+
+        self.assertTrue(len(documents) > first_page['result_count'],
+                        "More than one page of results.")
+        self.assertEqual(len(documents), first_page['search_result_total'],
+                         "All pages retrieved within the limit.")
+        self.assertEqual(len(node_ids), len(documents),
+                         "No result is repeated.")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,13 +1,90 @@
 #!/usr/bin/env python
 
+import json
 import unittest
 import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+from cache import DiskCache, LRUCache
+from mirror import NamespaceMirror
 from osdf import OSDF
+from request import ConnectionPool, HttpRequest
+from workers import ConcurrencyController, imap
+
+try:
+    import jsonschema
+except ImportError:
+    jsonschema = None
 
 def _get_osdf():
     osdf = OSDF(OsdfTest.server, OsdfTest.username, OsdfTest.password)
     return osdf
 
+def _insert_parent_and_child(osdf):
+    """
+    Inserts a node and a child linking to it, returning both their IDs.
+    """
+    parent_id = osdf.insert_node(OsdfTest.test_node)
+
+    child = dict(OsdfTest.test_node)
+    child['linkage'] = {"related_to": [parent_id]}
+    child_id = osdf.insert_node(child)
+
+    return (parent_id, child_id)
+
+def _start_dropping_server(methods):
+    """
+    Starts a server that answers the first request on each connection, and
+    closes the connection without answering the second. The method of every
+    request received is appended to methods. Returns the server's port.
+    """
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.bind(("127.0.0.1", 0))
+    listener.listen(5)
+
+    def handle(conn):
+        data = conn.makefile('rb')
+
+        for answered in (True, False):
+            request_line = data.readline()
+
+            if not request_line:
+                break
+
+            length = 0
+
+            for line in iter(data.readline, "\r\n"):
+                (name, value) = line.split(":", 1)
+
+                if name.lower() == "content-length":
+                    length = int(value)
+
+            data.read(length)
+            methods.append(request_line.split()[0])
+
+            if answered:
+                conn.sendall("HTTP/1.1 200 OK\r\nContent-Length: 2\r\n" + \
+                             "\r\n{}")
+
+        conn.close()
+
+    def serve():
+        while True:
+            (conn, _) = listener.accept()
+
+            handler = threading.Thread(target=handle, args=(conn,))
+            handler.daemon = True
+            handler.start()
+
+    server = threading.Thread(target=serve)
+    server.daemon = True
+    server.start()
+
+    return listener.getsockname()[1]
+
 class OsdfTest(unittest.TestCase):
     if "OSDF_SERVER" in os.environ:
         server = os.environ.get("OSDF_SERVER")
@@ -85,6 +162,87 @@ class OsdfTest(unittest.TestCase):
 
         self.assertFalse(get_success, "Deletion persisted in OSDF.")
 
+    def testDeleteNodes(self):
+        osdf = _get_osdf()
+
+        node_ids = [osdf.insert_node(OsdfTest.test_node) for _ in range(3)]
+
+        results = list(osdf.delete_nodes(node_ids, concurrency=2))
+
+        self.assertEqual([node_id for (node_id, _) in results], node_ids,
+                         "Results are in input order.")
+
+        for (_, error) in results:
+            self.assertIsNone(error, "Deletion did not fail.")
+
+    def testDeleteSubtree(self):
+        osdf = _get_osdf()
+
+        (parent_id, child_id) = _insert_parent_and_child(osdf)
+        deleted = False
+
+        try:
+            plan = osdf.delete_subtree(parent_id, dry_run=True)
+
+            self.assertEqual(plan, [[child_id], [parent_id]],
+                             "Dependent node is deleted before its parent.")
+
+            # Nothing is deleted in a dry run
+            self.assertIsNotNone(osdf.get_node(child_id))
+
+            osdf.delete_subtree(parent_id)
+            deleted = True
+
+            for node_id in (child_id, parent_id):
+                exception_thrown = False
+
+                try:
+                    osdf.get_node(node_id)
+                except Exception:
+                    exception_thrown = True
+
+                self.assertTrue(exception_thrown, "Node was deleted.")
+        finally:
+            if not deleted:
+                osdf.delete_node(child_id)
+                osdf.delete_node(parent_id)
+
+    def testExportImport(self):
+        osdf = _get_osdf()
+
+        (parent_id, child_id) = _insert_parent_and_child(osdf)
+
+        query = json.dumps({"query": {"ids": {"values": [parent_id,
+                                                         child_id]}}})
+        tempdir = tempfile.mkdtemp()
+        path = os.path.join(tempdir, "test.ndjson.gz")
+        new_ids = {}
+
+        try:
+            exported = osdf.export_namespace("test", path, query)
+
+            self.assertTrue(exported['documents'] >= 2, "Nodes exported.")
+            self.assertFalse(os.path.exists(path + ".checkpoint"),
+                             "Checkpoint removed once complete.")
+
+            summary = osdf.import_namespace(path, concurrency=2)
+            new_ids = summary['ids']
+
+            self.assertEqual(summary['failed'], 0, "Import did not fail.")
+            self.assertEqual(summary['inserted'], exported['documents'],
+                             "Every exported node was imported.")
+
+            new_child = osdf.get_node(new_ids[child_id])
+
+            self.assertEqual(new_child['linkage']['related_to'],
+                             [new_ids[parent_id]],
+                             "Linkage refers to the imported parent.")
+        finally:
+            for node_id in list(new_ids.values()) + [child_id, parent_id]:
+                osdf.delete_node(node_id)
+
+            shutil.rmtree(tempdir)
+
     def testGetInfo(self):
         osdf = _get_osdf()
 
@@ -108,6 +266,18 @@ class OsdfTest(unittest.TestCase):
         self.assertTrue('technical_contact1' in info)
         self.assertTrue('technical_contact2' in info)
 
+    def testClose(self):
+        osdf = _get_osdf()
+
+        # Retrieve once to open a persistent connection, then close it
+        osdf.get_info()
+        osdf.close()
+
+        # The client should transparently reconnect after being closed
+        info = osdf.get_info()
+
+        self.assertIsNotNone(info, "Information retrieved after close().")
+
     def testEditNode(self):
         osdf = _get_osdf()
 
@@ -140,6 +310,27 @@ class OsdfTest(unittest.TestCase):
         # Cleanup by deleting this document
         osdf.delete_node(node_id)
 
+    def testEditNodes(self):
+        osdf = _get_osdf()
+
+        node_ids = [osdf.insert_node(OsdfTest.test_node) for _ in range(2)]
+        documents = [osdf.get_node(node_id) for node_id in node_ids]
+
+        documents[0]['meta'] = dict(documents[0]['meta'], edited=True)
+        documents.append({"ns": "test"})
+
+        summary = osdf.edit_nodes(documents, concurrency=2)
+
+        for node_id in node_ids:
+            osdf.delete_node(node_id)
+
+        self.assertEqual(summary['changed'], 1, "Changed node was edited.")
+        self.assertEqual(summary['unchanged'], 1,
+                         "Unchanged node was skipped.")
+        self.assertEqual(summary['failed'], 1,
+                         "Document without an ID failed.")
+        self.assertEqual(len(summary['errors']), 1, "Failure was reported.")
+
     def testGetNode(self):
         osdf = _get_osdf()
 
@@ -179,6 +370,324 @@ class OsdfTest(unittest.TestCase):
             # particular test
             pass
 
+    def testGetNodes(self):
+        osdf = _get_osdf()
+
+        node_ids = [osdf.insert_node(OsdfTest.test_node) for _ in range(3)]
+        requested = node_ids + ["nonexistent", (node_ids[0], 1)]
+
+        results = list(osdf.get_nodes(requested, max_workers=2))
+
+        self.assertEqual([result[0] for result in results], requested,
+                         "Results are in the requested order.")
+
+        for (node_id, node, error) in results[:3]:
+            self.assertIsNone(error)
+            self.assertEqual(node['id'], node_id)
+
+        # The failure should be reported, not raised
+        self.assertIsNone(results[3][1])
+        self.assertIsNotNone(results[3][2])
+
+        # Versioned retrieval
+        self.assertIsNone(results[4][2])
+        self.assertEqual(results[4][1]['id'], node_ids[0])
+
+        for node_id in node_ids:
+            osdf.delete_node(node_id)
+
+    def testMirror(self):
+        osdf = _get_osdf()
+
+        node_id = osdf.insert_node(OsdfTest.test_node)
+        tempdir = tempfile.mkdtemp()
+
+        try:
+            mirror = NamespaceMirror(os.path.join(tempdir, "test.db"), "test")
+            osdf.mirror = mirror
+            osdf.query_cache = LRUCache(10)
+
+            stats = osdf.refresh_mirror()
+
+            self.assertTrue(stats['stored'] > 0, "Nodes copied to the mirror.")
+            self.assertEqual(len(osdf.query_cache), 0,
+                             "Refresh bypasses the query cache.")
+            self.assertTrue(node_id in mirror, "Inserted node is mirrored.")
+
+            node = osdf.get_node(node_id)
+
+            self.assertEqual(node['id'], node_id,
+                             "Node retrieved from the mirror.")
+
+            stats = osdf.refresh_mirror()
+
+            self.assertEqual(stats['stored'], 0,
+                             "Unchanged nodes are not copied again.")
+
+            deleted_id = node_id
+            osdf.delete_node(node_id)
+            node_id = None
+
+            self.assertFalse(deleted_id in mirror,
+                             "Deleted node is removed from the mirror.")
+
+            mirror.close()
+        finally:
+            if node_id is not None:
+                osdf.delete_node(node_id)
+
+            shutil.rmtree(tempdir)
+
+    def testRetryOfDroppedRequests(self):
+        methods = []
+        port = _start_dropping_server(methods)
+        request = HttpRequest("127.0.0.1", "user", "password", port,
+                              pool=ConnectionPool("127.0.0.1", port, maxsize=1))
+
+        request.get("/info")
+
+        with self.assertRaises(Exception):
+            request.post("/nodes", "{}")
+
+        self.assertEqual(methods.count("POST"), 1,
+                         "Sent insertion is not retried.")
+
+        request.get("/info")
+        response = request.get("/info")
+
+        self.assertEqual(response['code'], 200,
+                         "Dropped retrieval is retried.")
+        self.assertEqual(methods.count("GET"), 4,
+                         "Dropped retrieval is sent again.")
+
+    def testMirrorLinks(self):
+        osdf = _get_osdf()
+
+        (parent_id, child_id) = _insert_parent_and_child(osdf)
+
+        tempdir = tempfile.mkdtemp()
+
+        try:
+            mirror = NamespaceMirror(os.path.join(tempdir, "test.db"), "test")
+            osdf.mirror = mirror
+
+            # Only the child is read through to a mirror never refreshed.
+            osdf.get_node(child_id)
+
+            linked = osdf.get_nodes_out(child_id)['results']
+
+            self.assertEqual([node['id'] for node in linked], [parent_id],
+                             "Unrefreshed mirror is not used for links.")
+
+            stats = osdf.refresh_mirror()
+
+            self.assertEqual(stats['unchanged'], 0,
+                             "First refresh copies the whole namespace.")
+
+            mirror.remove([parent_id])
+
+            linked = osdf.get_nodes_out(child_id)['results']
+
+            self.assertEqual([node['id'] for node in linked], [parent_id],
+                             "Links to nodes not mirrored use the server.")
+
+            # Writes through the client keep a refreshed mirror complete
+            osdf.refresh_mirror()
+            osdf.edit_node(osdf.get_node(child_id))
+
+            sibling = dict(OsdfTest.test_node)
+            sibling['linkage'] = {"related_to": [parent_id]}
+            sibling_id = osdf.insert_node(sibling)
+
+            linked = osdf.get_nodes_in(parent_id)['results']
+
+            self.assertEqual(set([node['id'] for node in linked]),
+                             set([child_id, sibling_id]),
+                             "Edited and inserted nodes are mirrored.")
+
+            osdf.delete_node(sibling_id)
+
+            mirror.remove([child_id])
+
+            plan = osdf.delete_subtree(parent_id, dry_run=True)
+
+            self.assertEqual(plan, [[child_id], [parent_id]],
+                             "Deletion is planned from the server.")
+
+            osdf.mirror = None
+            mirror.close()
+        finally:
+            osdf.delete_node(child_id)
+            osdf.delete_node(parent_id)
+
+            shutil.rmtree(tempdir)
+
+    def testConcurrencyStats(self):
+        osdf = OSDF(OsdfTest.server, OsdfTest.username, OsdfTest.password,
+                    max_concurrency=4)
+
+        node_ids = [osdf.insert_node(OsdfTest.test_node) for _ in range(3)]
+
+        results = list(osdf.get_nodes(node_ids))
+
+        for node_id in node_ids:
+            osdf.delete_node(node_id)
+
+        for (_, node, error) in results:
+            self.assertIsNone(error, "Node retrieved under the controller.")
+
+        stats = osdf.concurrency_stats()
+
+        self.assertTrue(1 <= stats['limit'] <= 4,
+                        "Concurrency limit is within bounds.")
+        self.assertEqual(stats['in_flight'], 0, "No requests left in flight.")
+
+    def testConcurrencyBaselines(self):
+        controller = ConcurrencyController(initial=4)
+
+        # A cheap kind of request, then a costlier but steady one
+        for (kind, latency) in [('node', 0.001)] * 4 + [('page', 0.1)] * 8:
+            started = controller.acquire()
+            controller.release(started - latency, kind=kind)
+
+        limit = controller.limit
+
+        self.assertTrue(limit > 4, "Costlier requests are not judged as slow.")
+
+        started = controller.acquire()
+        controller.release(started - 1, kind='page')
+
+        self.assertTrue(controller.limit < limit,
+                        "Slower requests of the same kind cut the limit.")
+
+        controller.forget('node')
+        controller.forget('page')
+
+        self.assertEqual(controller.stats()['baseline_latencies'], [],
+                         "Baselines are forgotten.")
+
+    def testImapWhileInputPending(self):
+        first_result = threading.Event()
+        waits = []
+
+        def items():
+            """ Holds back the second item until the first result is in. """
+            yield 1
+            waits.append(first_result.wait(5))
+            yield 2
+
+        results = []
+
+        for (_, _, result, _) in imap(lambda item: item * 2, items(), 1):
+            results.append(result)
+            first_result.set()
+
+        self.assertEqual(results, [2, 4], "Every item was processed.")
+        self.assertEqual(waits, [True],
+                         "Results are yielded while input is pending.")
+
+    def testImapWindow(self):
+        pulled = []
+
+        def items():
+            """ Records how far the iterable has been read. """
+            for item in range(20):
+                pulled.append(item)
+                yield item
+
+        for (index, _, _, _) in imap(lambda item: item, items(), 4,
+                                     window=2):
+            time.sleep(0.01)
+
+            self.assertTrue(len(pulled) <= index + 3,
+                            "No more than the window is read ahead.")
+
+    def testGetNodeLazy(self):
+        osdf = OSDF(OsdfTest.server, OsdfTest.username, OsdfTest.password,
+                    lazy_results=True)
+
+        node_id = osdf.insert_node(OsdfTest.test_node)
+        retrieved = osdf.get_node(node_id)
+
+        self.assertEqual(retrieved['id'], node_id,
+                         "Retrieved node has the right ID.")
+        self.assertEqual(retrieved['meta'], OsdfTest.test_node['meta'],
+                         "Lazily decoded metadata is correct.")
+
+        materialized = retrieved.materialize()
+
+        self.assertTrue(type(materialized) == dict,
+                        "Materialized node is a dict.")
+
+        osdf.delete_node(node_id)
+
+    def testNodeCache(self):
+        osdf = OSDF(OsdfTest.server, OsdfTest.username, OsdfTest.password,
+                    cache_size=10)
+
+        node_id = osdf.insert_node(OsdfTest.test_node)
+
+        osdf.get_node(node_id)
+        osdf.get_node(node_id)
+        osdf.get_node_by_version(node_id, 1)
+        osdf.get_node_by_version(node_id, 1)
+
+        stats = osdf.cache_stats()
+
+        self.assertEqual(stats['node']['hits'], 1, "Node cache was used.")
+        self.assertEqual(stats['version']['hits'], 1,
+                         "Node version cache was used.")
+
+        osdf.delete_node(node_id)
+
+        # The deletion should have removed the node from the cache
+        get_success = True
+        try:
+            osdf.get_node(node_id)
+        except Exception:
+            get_success = False
+
+        self.assertFalse(get_success, "Deleted node was not cached.")
+
+    def testTraverse(self):
+        osdf = _get_osdf()
+
+        (parent_id, child_id) = _insert_parent_and_child(osdf)
+
+        try:
+            traversal = osdf.traverse(parent_id, direction='in')
+            found = dict([(node_id, depth)
+                          for (node_id, _, depth) in traversal])
+
+            self.assertEqual(found.get(parent_id), 0,
+                             "Starting node is at depth 0.")
+            self.assertEqual(found.get(child_id), 1,
+                             "Linking node is at depth 1.")
+            self.assertEqual(traversal.adjacency[child_id], set([parent_id]),
+                             "Adjacency records the linkage.")
+
+            adjacency = osdf.traverse(parent_id, direction='in',
+                                      max_depth=0).run()
+
+            self.assertEqual(list(adjacency.keys()), [parent_id],
+                             "Traversal stops at max_depth.")
+
+            # A unicode node ID is a single starting node
+            unicode_id = u"%s" % parent_id
+            adjacency = osdf.traverse(unicode_id, direction='in').run()
+
+            self.assertEqual(set(adjacency.keys()),
+                             set([parent_id, child_id]),
+                             "Traversal starts from a unicode node ID.")
+
+            plan = osdf.delete_subtree(unicode_id, dry_run=True)
+
+            self.assertEqual(plan, [[child_id], [parent_id]],
+                             "Deletion is planned from a unicode node ID.")
+        finally:
+            osdf.delete_node(child_id)
+            osdf.delete_node(parent_id)
+
     def testInsertNode(self):
         osdf = _get_osdf()
 
@@ -199,6 +708,65 @@ class OsdfTest(unittest.TestCase):
         self.assertTrue(type(node_id) == str,
                         "Node ID for inserted data is a string.")
 
+    def testInsertNodes(self):
+        osdf = _get_osdf()
+
+        documents = (OsdfTest.test_node for _ in range(3))
+
+        results = list(osdf.insert_nodes(documents, concurrency=2))
+
+        self.assertEqual([result[0] for result in results], [0, 1, 2],
+                         "Results are indexed in input order.")
+
+        for (_, node_id, error) in results:
+            self.assertIsNone(error, "Insertion did not fail.")
+            self.assertTrue(type(node_id) == str,
+                            "Node ID for inserted data is a string.")
+
+            osdf.delete_node(node_id)
+
+    def testRequestStats(self):
+        osdf = _get_osdf()
+
+        records = []
+        osdf.metrics.add_listener(records.append)
+
+        osdf.get_info()
+
+        stats = osdf.request_stats()
+
+        self.assertTrue('GET /info' in stats, "Requests grouped by endpoint.")
+        self.assertEqual(stats['GET /info']['count'], 1,
+                         "Request was counted.")
+        self.assertEqual(stats['GET /info']['decode_count'], 1,
+                         "Decoding was timed.")
+
+        self.assertEqual(len(records), 1, "Listener received the request.")
+        self.assertEqual(records[0]['status'], 200,
+                         "Listener received the status.")
+
+        osdf.metrics.reset()
+
+        self.assertEqual(osdf.request_stats(), {}, "Statistics were reset.")
+
+    def testTransferStats(self):
+        osdf = OSDF(OsdfTest.server, OsdfTest.username, OsdfTest.password,
+                    compress_threshold=0)
+
+        node_id = osdf.insert_node(OsdfTest.test_node)
+        node = osdf.get_node(node_id)
+        osdf.delete_node(node_id)
+
+        self.assertEqual(node['meta'], OsdfTest.test_node['meta'],
+                         "Node inserted and retrieved with compression.")
+
+        stats = osdf.transfer_stats()
+
+        self.assertTrue(stats['bytes_sent_uncompressed'] > 0,
+                        "Bytes sent were counted.")
+        self.assertTrue(stats['bytes_received_uncompressed'] > 0,
+                        "Bytes received were counted.")
+
     def testOqlQuery(self):
         osdf = _get_osdf()
 
@@ -218,6 +786,17 @@ class OsdfTest(unittest.TestCase):
         results = osdf.oql_query_all_pages(namespace, query)
         self._examine_all_results(results, "OQL")
 
+    def testIterOqlQuery(self):
+        osdf = _get_osdf()
+
+        query = '"project"[node_type]'
+        namespace = "test"
+
+        all_results = osdf.oql_query_all_pages(namespace, query)
+        documents = list(osdf.iter_oql_query(namespace, query))
+
+        self.assertEqual(len(documents), all_results['result_count'],
+                         "Iterated over all OQL results.")
 
     def testValidateNode(self):
         osdf = _get_osdf()
@@ -236,6 +815,53 @@ class OsdfTest(unittest.TestCase):
 
         self.assertIsNone(err_message, "Error message is None for passed validation.")
 
+    @unittest.skipIf(jsonschema is None, "jsonschema is not installed.")
+    def testValidateNodeLocally(self):
+        osdf = _get_osdf()
+
+        # The schema's meta property refers to an auxiliary schema
+        bad_node = dict(OsdfTest.test_node)
+        bad_node['meta'] = "not an object"
+
+        (is_valid, err_message) = osdf.validate_node(bad_node, local=True)
+
+        self.assertFalse(is_valid, "Local validity check flagged bad data.")
+        self.assertTrue(err_message.startswith("meta: "),
+                        "Error is reported by the local validator.")
+
+        results = list(osdf.validate_nodes("test", [OsdfTest.test_node]))
+
+        self.assertEqual(results, [(True, None)],
+                         "Local validity check passed valid data.")
+
+        documents = [OsdfTest.test_node, bad_node] * 3
+        results = list(osdf.validate_nodes("test", documents, processes=2))
+
+        self.assertEqual([valid for (valid, _) in results],
+                         [True, False] * 3,
+                         "Parallel validation results are in order.")
+
+    def testValidateNodeWithoutJsonschema(self):
+        import validator
+
+        osdf = _get_osdf()
+        installed = validator.jsonschema
+        validator.jsonschema = None
+
+        try:
+            for _ in range(3):
+                (is_valid, _) = osdf.validate_node(OsdfTest.test_node,
+                                                   local=True)
+
+                self.assertTrue(is_valid, "Server validated the node.")
+        finally:
+            validator.jsonschema = installed
+
+        stats = osdf.request_stats()
+
+        self.assertEqual([endpoint for endpoint in stats
+                          if 'schemas' in endpoint], [],
+                         "No schemas retrieved without jsonschema.")
 
     def testRetrieveSchema(self):
         osdf = _get_osdf()
@@ -273,6 +899,26 @@ class OsdfTest(unittest.TestCase):
         # Check that the returned value contains data
         self.assertIsNotNone(schemas, "Retrieval of all schemas yielded results.")
 
+    def testSchemaCache(self):
+        osdf = OSDF(OsdfTest.server, OsdfTest.username, OsdfTest.password,
+                    schema_ttl=300)
+        namespace = "test"
+        schema_name = "example"
+
+        schemas = osdf.get_schemas(namespace)
+        schema = osdf.get_schema(namespace, schema_name)
+
+        self.assertEqual(schema, schemas[schema_name],
+                         "Cached schema matches the bulk retrieval.")
+
+        self.assertEqual(osdf.cache_stats()['schema']['hits'], 1,
+                         "Schema was served from the cache.")
+
+        # Changing the retrieved schemas leaves the cached ones untouched
+        schemas[schema_name]['type'] = "array"
+
+        self.assertEqual(osdf.get_schema(namespace, schema_name), schema,
+                         "Cached schema is not shared with the caller.")
 
     def testQuery(self):
         osdf = _get_osdf()
@@ -284,6 +930,105 @@ class OsdfTest(unittest.TestCase):
 
         self._examine_paged_results(results, "ES QueryDSL")
 
+    def testQueryFields(self):
+        osdf = _get_osdf()
+
+        query = '{ "query": { "term" : { "node_type" : "project" }} }'
+        namespace = "test"
+
+        results = osdf.query(namespace, query, fields=["id", "node_type"])
+
+        for document in results['results']:
+            self.assertTrue(set(document).issubset(["id", "node_type"]),
+                            "Only the requested fields were retrieved.")
+
+        results = osdf.oql_query(namespace, '"project"[node_type]',
+                                 fields=["node_type"])
+
+        for document in results['results']:
+            self.assertEqual(list(document.keys()), ["node_type"],
+                             "OQL results were trimmed to the fields.")
+
+    def testQueryCache(self):
+        osdf = OSDF(OsdfTest.server, OsdfTest.username, OsdfTest.password,
+                    query_cache=LRUCache(10, ttl=60))
+
+        query = '{ "query": { "term" : { "node_type" : "example" }} }'
+        namespace = "test"
+
+        first = osdf.query(namespace, query)
+        second = osdf.query(namespace, query)
+
+        self.assertEqual(first, second, "Cached results match.")
+        self.assertEqual(osdf.cache_stats()['query']['hits'], 1,
+                         "Query was served from the cache.")
+
+        # Inserting a node into the namespace invalidates its results
+        node_id = osdf.insert_node(OsdfTest.test_node)
+        osdf.query(namespace, query)
+        osdf.delete_node(node_id)
+
+        self.assertEqual(osdf.cache_stats()['query']['hits'], 1,
+                         "Results were retrieved again after an insert.")
+
+        osdf.query(namespace, query, cached=False)
+
+        self.assertEqual(osdf.cache_stats()['query']['hits'], 1,
+                         "Cache was bypassed.")
+
+    def testQueryCacheOnDisk(self):
+        tempdir = tempfile.mkdtemp()
+
+        try:
+            query_cache = DiskCache(os.path.join(tempdir, "queries.db"), 10)
+            osdf = OSDF(OsdfTest.server, OsdfTest.username, OsdfTest.password,
+                        query_cache=query_cache)
+
+            query = '{ "query": { "term" : { "node_type" : "example" }} }'
+
+            osdf.query("test", query)
+            osdf.query("other", query)
+
+            self.assertEqual(len(query_cache.tags()), 2,
+                             "Results are tagged by namespace.")
+
+            node_id = osdf.insert_node(OsdfTest.test_node)
+
+            self.assertEqual(len(query_cache), 1,
+                             "Insert discards the results of its namespace.")
+
+            osdf.delete_node(node_id)
+
+            self.assertEqual(len(query_cache), 0,
+                             "Delete discards the results of the server.")
+
+            query_cache.close()
+        finally:
+            shutil.rmtree(tempdir)
+
+    def testQueryCacheBackend(self):
+        class DelegatingCache(object):
+            """ A cache of another kind than the client's own. """
+            def __init__(self):
+                self.cache = LRUCache(10)
+
+            def __getattr__(self, name):
+                return getattr(self.cache, name)
+
+        osdf = _get_osdf()
+        osdf.query_cache = DelegatingCache()
+
+        query = '{ "query": { "term" : { "node_type" : "example" }} }'
+
+        osdf.query("test", query)
+        osdf.query("test", query)
+
+        self.assertEqual(osdf.cache_stats()['query']['hits'], 1,
+                         "Query was served from the other kind of cache.")
+
+        with self.assertRaises(ValueError):
+            osdf.query_cache = {}
+
     def testQueryAllPages(self):
         osdf = _get_osdf()
 
@@ -294,6 +1039,18 @@ class OsdfTest(unittest.TestCase):
 
         self._examine_all_results(results, "ES QueryDSL")
 
+    def testIterQuery(self):
+        osdf = _get_osdf()
+
+        query = '{ "query": { "term" : { "node_type" : "project" }}}'
+        namespace = "test"
+
+        all_results = osdf.query_all_pages(namespace, query)
+        documents = list(osdf.iter_query(namespace, query))
+
+        self.assertEqual(len(documents), all_results['result_count'],
+                         "Iterated over all ES QueryDSL results.")
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,146 @@
+"""
+Breadth-first traversal of the OSDF node graph along node linkages.
+"""
+
+import workers
+
+DIRECTIONS = ('in', 'out', 'both')
+
+class Traversal(object):
+    """
+    Walks the graph of nodes reachable from a set of starting nodes, one
+    level of linkage at a time. The neighbors of every node in a level are
+    retrieved concurrently, and each node is only visited once no matter how
+    many paths lead to it.
+
+    Iterating over a traversal yields (node_id, node, depth) tuples as nodes
+    are discovered, the starting nodes being at depth 0. While it runs, the
+    traversal records:
+
+    adjacency - a dictionary mapping the ID of each visited node to the set
+                of IDs of the visited nodes it links to.
+    errors    - a dictionary mapping the ID of any node whose neighbors, or
+                which itself, could not be retrieved to the exception raised.
+                The traversal carries on past such failures.
+    """
+
+    def __init__(self, osdf, start_ids, direction='out', max_depth=None,
+                 node_types=None, max_workers=None, fresh=False):
+        if direction not in DIRECTIONS:
+            raise ValueError("Invalid traversal direction: %s." % direction)
+
+        #pylint: disable=undefined-variable
+        if isinstance(start_ids, basestring):
+            start_ids = [start_ids]
+
+        self.osdf = osdf
+        self.start_ids = list(start_ids)
+        self.direction = direction
+        self.max_depth = max_depth
+        self.max_workers = max_workers
+        self.fresh = fresh
+
+        if node_types is None:
+            self.node_types = None
+        else:
+            self.node_types = frozenset(node_types)
+
+        self.adjacency = {}
+        self.errors = {}
+
+    def _neighbors(self, task):
+        (node_id, direction) = task
+
+        if direction == 'in':
+            response = self.osdf.get_nodes_in(node_id, self.fresh)
+        else:
+            response = self.osdf.get_nodes_out(node_id, self.fresh)
+
+        # Linked nodes come back in the same form as query results
+        if isinstance(response, list):
+            return response
+
+        return response['results']
+
+    def __iter__(self):
+        self.adjacency = {}
+        self.errors = {}
+
+        frontier = []
+
+        for (node_id, node, error) in self.osdf.get_nodes(
+                self.start_ids, max_workers=self.max_workers):
+            if error is not None:
+                self.errors[node_id] = error
+                continue
+
+            if node_id in self.adjacency:
+                continue
+
+            self.adjacency[node_id] = set()
+            frontier.append(node_id)
+
+            yield (node_id, node, 0)
+
+        if self.direction == 'both':
+            directions = ('in', 'out')
+        else:
+            directions = (self.direction,)
+
+        # Unless capped, the client's concurrency controller decides how
+        # many requests are made at once.
+        max_workers = self.max_workers or self.osdf.controller.maximum
+        depth = 0
+
+        while frontier and (self.max_depth is None or depth < self.max_depth):
+            depth += 1
+
+            tasks = [(node_id, direction)
+                     for node_id in frontier for direction in directions]
+            edges = []
+            frontier = []
+
+            for (_, task, neighbors, error) in workers.imap(
+                    self._neighbors, tasks, max_workers, ordered=False,
+                    controller=self.osdf.controller, idempotent=True):
+                (node_id, direction) = task
+
+                if error is not None:
+                    self.errors[node_id] = error
+                    continue
+
+                for neighbor in neighbors:
+                    neighbor_id = neighbor['id']
+
+                    if direction == 'out':
+                        edges.append((node_id, neighbor_id))
+                    else:
+                        edges.append((neighbor_id, node_id))
+
+                    if neighbor_id in self.adjacency:
+                        continue
+
+                    if self.node_types is not None and \
+                            neighbor['node_type'] not in self.node_types:
+                        continue
+
+                    self.adjacency[neighbor_id] = set()
+                    frontier.append(neighbor_id)
+
+                    yield (neighbor_id, neighbor, depth)
+
+            # Edges are only recorded between nodes that were visited, which
+            # is only known once the whole level has been seen.
+            for (source_id, target_id) in edges:
+                if source_id in self.adjacency and target_id in self.adjacency:
+                    self.adjacency[source_id].add(target_id)
+
+    def run(self):
+        """
+        Carry out the whole traversal without keeping the nodes, and return
+        the adjacency dictionary.
+        """
+        for _ in self:
+            pass
+
+        return self.adjacency
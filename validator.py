@@ -0,0 +1,160 @@
+"""
+Client-side validation of OSDF node documents against a namespace's
+JSON-Schemas. Requires the jsonschema package.
+"""
+
+try:
+    import jsonschema
+except ImportError:
+    jsonschema = None
+
+# The top level keys every OSDF node document must have.
+REQUIRED_KEYS = ('ns', 'acl', 'linkage', 'node_type', 'meta')
+
+# The validator used by worker processes when validating in parallel.
+_WORKER_VALIDATOR = None
+
+def _require_jsonschema():
+    """ Raises an ImportError if the jsonschema package is missing. """
+    if jsonschema is None:
+        raise ImportError("The jsonschema package is required for " + \
+                          "client-side validation.")
+
+def _init_worker(validator):
+    """ Stores the validator for use by a worker process. """
+    global _WORKER_VALIDATOR #pylint: disable=global-statement
+    _WORKER_VALIDATOR = validator
+
+def _validate_in_worker(json_data):
+    """ Validates a document in a worker process. """
+    return _WORKER_VALIDATOR.validate(json_data)
+
+class NodeValidator(object):
+    """
+    Validates OSDF node documents in-process against the schemas and
+    auxiliary schemas of a namespace, as retrieved with get_schemas() and
+    get_aux_schemas(). References ($ref) to auxiliary schemas are resolved
+    by name. Schemas are compiled the first time they are needed.
+    """
+
+    def __init__(self, namespace, schemas, aux_schemas=None):
+        _require_jsonschema()
+
+        self.namespace = namespace
+        self.schemas = schemas
+        self.aux_schemas = aux_schemas or {}
+
+        self._compiled = {}
+
+    @classmethod
+    def from_osdf(cls, osdf, namespace):
+        """
+        Create a validator for a namespace, retrieving its schemas and
+        auxiliary schemas from the given OSDF client. Nothing is retrieved
+        if jsonschema is missing.
+        """
+        _require_jsonschema()
+
+        schemas = osdf.get_schemas(namespace)
+        aux_schemas = osdf.get_aux_schemas(namespace)
+
+        return cls(namespace, schemas, aux_schemas)
+
+    def __getstate__(self):
+        # Compiled schemas are rebuilt, rather than pickled, when the
+        # validator is sent to worker processes.
+        state = self.__dict__.copy()
+        state['_compiled'] = {}
+
+        return state
+
+    def _get_compiled(self, node_type):
+        if node_type not in self._compiled:
+            schema = self.schemas.get(node_type)
+
+            if schema is None:
+                compiled = None
+            else:
+                resolver = jsonschema.RefResolver('', schema,
+                                                  store=self.aux_schemas)
+                compiled = jsonschema.Draft4Validator(schema, resolver=resolver)
+
+            self._compiled[node_type] = compiled
+
+        return self._compiled[node_type]
+
+    def validate(self, json_data):
+        """
+        Report whether a node document is valid according to the namespace's
+        schemas.
+
+        Returns a tuple with the first value holding a boolean of whether the
+        document validated or not. The second value contains the error message
+        if the document did not validate.
+        """
+        if not isinstance(json_data, dict):
+            return (False, "Node document is not a JSON object.")
+
+        for key in REQUIRED_KEYS:
+            if key not in json_data:
+                return (False, "Node document is missing '%s'." % key)
+
+        if json_data['ns'] != self.namespace:
+            msg = "Node namespace '%s' does not match '%s'." \
+                % (json_data['ns'], self.namespace)
+            return (False, msg)
+
+        acl = json_data['acl']
+
+        if not isinstance(acl, dict) or \
+                not isinstance(acl.get('read'), list) or \
+                not isinstance(acl.get('write'), list):
+            return (False, "Node acl must have 'read' and 'write' lists.")
+
+        if not isinstance(json_data['linkage'], dict):
+            return (False, "Node linkage must be a JSON object.")
+
+        # Node types without a registered schema are only checked for their
+        # basic structure.
+        compiled = self._get_compiled(json_data['node_type'])
+
+        if compiled is None:
+            return (True, None)
+
+        error = jsonschema.exceptions.best_match(compiled.iter_errors(json_data))
+
+        if error is None:
+            return (True, None)
+
+        path = "/".join([str(element) for element in error.path])
+
+        if path:
+            error_msg = "%s: %s" % (path, error.message)
+        else:
+            error_msg = error.message
+
+        return (False, error_msg)
+
+    def validate_many(self, documents, processes=None, chunksize=100):
+        """
+        Validate many node documents, yielding a (valid, error_msg) tuple for
+        each one in the same order as documents. If processes is greater than
+        1, the documents are validated in parallel by that many worker
+        processes.
+        """
+        if not processes or processes <= 1:
+            for json_data in documents:
+                yield self.validate(json_data)
+
+            return
+
+        import multiprocessing
+
+        pool = multiprocessing.Pool(processes, _init_worker, (self,))
+
+        try:
+            for result in pool.imap(_validate_in_worker, documents, chunksize):
+                yield result
+        finally:
+            pool.terminate()
+            pool.join()
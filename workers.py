@@ -0,0 +1,347 @@
+"""
+Thread-based helpers for issuing many OSDF requests concurrently.
+"""
+
+import Queue
+import httplib
+import random
+import socket
+import threading
+import time
+from request import HTTPStatusException
+
+_STOP = object()
+
+# Marks the feeder's report that the iterable is exhausted
+_FED = object()
+
+# Response statuses indicating that the server is overloaded, or otherwise
+# temporarily unable to handle a request.
+OVERLOAD_STATUSES = frozenset([429, 500, 502, 503, 504])
+
+def is_overload(error):
+    """
+    Report whether an exception raised by a request signals that the server
+    is overloaded or unreachable, rather than a problem with the request
+    itself.
+    """
+    if isinstance(error, HTTPStatusException):
+        return error.status in OVERLOAD_STATUSES
+
+    return isinstance(error, (socket.error, httplib.HTTPException))
+
+class ConcurrencyController(object):
+    """
+    Adapts the number of requests allowed in flight at once to what the
+    server can handle, in the manner of TCP congestion control. The limit
+    grows by about one for every limit's worth of requests that complete
+    with a healthy latency, and is cut back sharply when a request fails
+    because the server is overloaded, or more gently when the latency rises
+    above tolerance times the lowest latency recently seen for the same kind
+    of request. Only one cut is made for requests that were already in
+    flight when the limit was last reduced.
+
+    Calls made with run() that fail because of overload are retried, if
+    they are idempotent, after an exponentially growing, randomly jittered
+    delay. The controller may be shared by any number of threads and bulk
+    operations.
+    """
+
+    def __init__(self, initial=4, minimum=1, maximum=32, tolerance=2.0,
+                 retries=3, backoff=0.1, max_backoff=5.0):
+        if not 1 <= minimum <= maximum:
+            raise ValueError("Invalid concurrency limits.")
+
+        self.minimum = minimum
+        self.maximum = maximum
+        self.tolerance = tolerance
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+        self._limit = float(min(max(initial, minimum), maximum))
+        self._in_flight = 0
+        # The lowest latency recently seen for each kind of request, so that
+        # costly requests are not judged against cheap ones.
+        self._baselines = {}
+        self._last_cut = 0
+        self._condition = threading.Condition()
+
+    @property
+    def limit(self):
+        """ The current number of requests allowed in flight. """
+        return int(self._limit)
+
+    def stats(self):
+        """
+        Return a dictionary with the current limit, the number of requests
+        in flight and the sorted list of the baseline latencies (in seconds)
+        healthy requests of each kind are compared against.
+        """
+        with self._condition:
+            return {
+                'limit': int(self._limit),
+                'in_flight': self._in_flight,
+                'baseline_latencies': sorted(self._baselines.values())
+            }
+
+    def acquire(self):
+        """
+        Wait until another request may be made, and return the time it was
+        started, to be passed to release().
+        """
+        with self._condition:
+            while self._in_flight >= int(self._limit):
+                self._condition.wait()
+
+            self._in_flight += 1
+
+        return time.time()
+
+    def release(self, started, overloaded=False, kind=None):
+        """
+        Record the completion of a request of the given kind (any hashable
+        value) started at the given time, and whether it failed because the
+        server was overloaded.
+        """
+        now = time.time()
+        latency = now - started
+
+        with self._condition:
+            self._in_flight -= 1
+
+            baseline = self._baselines.get(kind)
+            slow = baseline is not None and \
+                latency > baseline * self.tolerance
+
+            if overloaded or slow:
+                # Requests sent before the last cut were made under the old
+                # limit, so they don't call for another one.
+                if started > self._last_cut:
+                    if overloaded:
+                        factor = 0.5
+                    else:
+                        factor = 0.8
+
+                    self._limit = max(self.minimum, self._limit * factor)
+                    self._last_cut = now
+            else:
+                self._limit = min(self.maximum, self._limit + 1 / self._limit)
+
+            if not overloaded:
+                # Track the lowest latency, letting it drift up slowly so
+                # that a change in the server's baseline is eventually
+                # accepted.
+                if baseline is None or latency < baseline:
+                    self._baselines[kind] = latency
+                else:
+                    self._baselines[kind] = \
+                        baseline + (latency - baseline) * 0.01
+
+            self._condition.notify_all()
+
+    def forget(self, kind):
+        """
+        Discard the baseline latency of a kind of request that will not be
+        made again.
+        """
+        with self._condition:
+            self._baselines.pop(kind, None)
+
+    def delay(self, attempt):
+        """
+        Return the time to wait before the given retry attempt (counting
+        from 0).
+        """
+        ceiling = min(self.max_backoff, self.backoff * (2 ** attempt))
+
+        return random.uniform(0, ceiling)
+
+    def run(self, func, item, idempotent=False, kind=None):
+        """
+        Call func(item) once the limit allows it, retrying idempotent calls
+        that fail because the server is overloaded. Its latency is judged
+        against that of earlier calls of the same kind.
+        """
+        attempt = 0
+
+        while True:
+            started = self.acquire()
+
+            try:
+                result = func(item)
+            except Exception as err:
+                overloaded = is_overload(err)
+                self.release(started, overloaded, kind)
+
+                if not (overloaded and idempotent and attempt < self.retries):
+                    raise
+
+                time.sleep(self.delay(attempt))
+                attempt += 1
+                continue
+
+            self.release(started, kind=kind)
+
+            return result
+
+def imap(func, iterable, max_workers=8, ordered=True, controller=None,
+         idempotent=False, window=None):
+    """
+    Apply func to every item of iterable using a pool of worker threads.
+
+    Items are pulled from the iterable lazily, by a separate thread, so only
+    a bounded number of them are held in memory at any one time, which makes
+    it safe to feed in a generator of arbitrary length. Results are yielded
+    as they complete even while the iterable blocks waiting for more input.
+
+    Yields (index, item, result, error) tuples, where index is the position
+    of the item in the iterable. If func raised an exception for an item,
+    result is None and error holds the exception; otherwise error is None.
+    A failure for one item does not stop the processing of the others.
+    Results are yielded in input order if ordered is True, or as soon as
+    each one completes otherwise. No more than window items (by default
+    max_workers, or twice that if ordered) are taken from the iterable ahead
+    of the results yielded.
+
+    If a ConcurrencyController is provided, max_workers only caps the number
+    of calls in flight, and the controller decides how many of them may run
+    at a time, retrying them if they are idempotent. The calls are judged
+    against each other's latency, not against those of other operations.
+    """
+    if max_workers < 1:
+        raise ValueError("max_workers must be at least 1.")
+
+    tasks = Queue.Queue()
+    results = Queue.Queue()
+
+    # Identifies the calls of this operation to the controller
+    kind = object()
+
+    def worker():
+        """ Processes tasks until told to stop. """
+        while True:
+            task = tasks.get()
+
+            if task is _STOP:
+                return
+
+            (index, item) = task
+
+            try:
+                if controller is None:
+                    result = func(item)
+                else:
+                    result = controller.run(func, item, idempotent, kind)
+
+                outcome = (index, item, result, None)
+            except Exception as err:
+                outcome = (index, item, None, err)
+
+            results.put(outcome)
+
+    threads = []
+
+    for _ in range(max_workers):
+        thread = threading.Thread(target=worker)
+        thread.daemon = True
+        thread.start()
+        threads.append(thread)
+
+    # When results must come back in order, allow some completed results to
+    # wait behind a slow one without starving the workers.
+    if window is None:
+        if ordered:
+            window = max_workers * 2
+        else:
+            window = max_workers
+
+    # Each item takes a slot until its result has been yielded.
+    slots = threading.Semaphore(window)
+    stopping = threading.Event()
+
+    def feeder():
+        """
+        Queues the items as slots allow, then reports how many there were,
+        along with any error raised by the iterable.
+        """
+        items = enumerate(iterable)
+        count = 0
+
+        while True:
+            slots.acquire()
+
+            if stopping.is_set():
+                return
+
+            try:
+                task = next(items)
+            except StopIteration:
+                results.put((_FED, count, None))
+                return
+            except Exception as err:
+                results.put((_FED, count, err))
+                return
+
+            tasks.put(task)
+            count += 1
+
+    feeding = threading.Thread(target=feeder)
+    feeding.daemon = True
+    feeding.start()
+
+    fed = None
+    received = 0
+    completed = {}
+    next_index = 0
+
+    try:
+        while fed is None or received < fed:
+            outcome = results.get()
+
+            if outcome[0] is _FED:
+                (_, fed, error) = outcome
+
+                if error is not None:
+                    raise error
+
+                continue
+
+            received += 1
+
+            if not ordered:
+                slots.release()
+                yield outcome
+                continue
+
+            completed[outcome[0]] = outcome
+
+            while next_index in completed:
+                outcome = completed.pop(next_index)
+                next_index += 1
+                slots.release()
+                yield outcome
+    finally:
+        # The feeder may be blocked on the iterable, such as a pipe, so it
+        # is not waited for.
+        stopping.set()
+        slots.release()
+
+        # Anything not yet picked up by a worker is abandoned.
+        while True:
+            try:
+                tasks.get_nowait()
+            except Queue.Empty:
+                break
+
+        for _ in range(max_workers):
+            tasks.put(_STOP)
+
+        # Wait for the workers, which only finish the calls already running
+        # before they exit. Otherwise, Python 2 may tear down the modules
+        # they use while they are still winding down at interpreter exit.
+        for thread in threads:
+            thread.join()
+
+        if controller is not None:
+            controller.forget(kind)